@@ -0,0 +1,118 @@
+"""
+batch_fix.py: Applies the subject and track fixes listed in a manifest to NWB files across a pool of worker processes.
+
+The manifest is a CSV file with one row per NWB file, or a YAML list of mappings with the same keys:
+    file                    path to the NWB file, relative to the manifest.
+    subject_id, description, sex, species, strain, date_of_birth, growth_stage, growth_stage_time, cultivation_temp
+                            subject fields to set, left empty to keep.
+    track_reference         source to rebuild TrackedNeurons from (maedeh), left empty to keep the tracks.
+    track_reference_path    directory holding the reference's annotations.h5 and worldlines.h5, relative to the
+                            manifest, derived from the subject when left empty.
+
+Each fixed file is written to <file>_updated.nwb, or over <file> with --in-place, through a temporary file that is
+only renamed into place once every fix succeeded and pynwb reads it back. A track fix exports the file to the temporary
+file and a subject fix patches the fields in place, exporting the file once more only for a field missing from it that
+the CElegansSubject spec gives no type for, so a file with both fixes is opened up to four times.
+
+Usage:
+    batch_fix.py -h | --help
+    batch_fix.py <manifest> [options]
+
+Options:
+    -h --help                           show this message and exit.
+    --workers=<workers>                 number of worker processes, 0 uses every available core. [default: 0]
+    --in-place                          replace each NWB file instead of writing an _updated copy next to it.
+"""
+
+import csv
+import os
+import shutil
+import time
+
+import yaml
+from docopt import docopt
+
+from .helper import print_results, run_pool
+
+SUBJECT_FIELDS = ['subject_id', 'description', 'sex', 'species', 'strain', 'date_of_birth', 'growth_stage',
+                  'growth_stage_time', 'cultivation_temp']
+
+
+def read_manifest(manifest_path):
+    with open(manifest_path, 'r', encoding='utf-8', newline='') as manifest_file:
+        if manifest_path.endswith(('.yaml', '.yml')):
+            rows = yaml.safe_load(manifest_file) or []
+        else:
+            rows = list(csv.DictReader(manifest_file))
+
+    root = os.path.dirname(os.path.abspath(manifest_path))
+    entries = []
+    for row in rows:
+        values = {key: str(value) for key, value in row.items() if value not in (None, '')}
+        if 'file' not in values:
+            raise ValueError(f"Manifest {manifest_path} has an entry without a file: {row}")
+
+        entries.append({'file': os.path.join(root, values['file']),
+                        'subject': {field: values[field] for field in SUBJECT_FIELDS if field in values},
+                        'reference': values.get('track_reference'),
+                        'reference_path': os.path.join(root, values['track_reference_path'])
+                        if 'track_reference_path' in values else None})
+
+    return entries
+
+
+def output_path(filepath, in_place=False):
+    return filepath if in_place else filepath.replace('.nwb', '_updated.nwb')
+
+
+def fix_file(filepath, subject, reference=None, reference_path=None, in_place=False):
+    from pynwb import NWBHDF5IO
+
+    from .fixer import TRACK_REFERENCES, fix_subject, fix_track
+
+    start = time.perf_counter()
+    result = {'file': filepath, 'output': output_path(filepath, in_place), 'error': None}
+
+    # Fixes are applied to a temporary file that replaces the output only once all of them succeeded.
+    partial_path = f"{result['output']}.partial"
+    try:
+        if reference is not None and reference not in TRACK_REFERENCES:
+            raise ValueError(f"Reference {reference} has no associated fix routine.")
+
+        # Exporting the new tracks writes the whole file anyway, otherwise the file is copied as is.
+        if reference is not None:
+            fix_track(filepath, reference, reference_path, output_path=partial_path)
+        else:
+            shutil.copyfile(filepath, partial_path)
+
+        if subject:
+            fix_subject(partial_path, **subject)
+
+        # A fixed file pynwb cannot read back is reported as a failure instead of replacing the output.
+        with NWBHDF5IO(partial_path, mode='r') as read_io:
+            read_io.read()
+
+        os.replace(partial_path, result['output'])
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+    result['elapsed'] = time.perf_counter() - start
+    return result
+
+
+def fix_manifest(entries, workers=None, in_place=False):
+    return run_pool(fix_file, [(entry['file'], entry['subject'], entry['reference'], entry['reference_path'], in_place)
+                               for entry in entries], workers)
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__, version='NWB Batch Fixer')
+
+    start = time.perf_counter()
+    counts = print_results(fix_manifest(read_manifest(args['<manifest>']), workers=int(args['--workers']),
+                                        in_place=args['--in-place']),
+                           lambda result: ('fixed', f"{result['output']} ({result['elapsed']:.1f}s)"))
+
+    print(f"\nFixed {counts['fixed']}, {counts['failed']} failed in {time.perf_counter() - start:.1f}s.")
@@ -0,0 +1,341 @@
+"""
+benchmarks.py: Times support_library routines on synthetic data, comparing each against the approach it replaced.
+
+Usage:
+    benchmarks.py -h | --help
+    benchmarks.py [options]
+
+Options:
+    -h --help                           show this message and exit.
+    --rois=<rois>                       number of voxel mask rows. [default: 1000000]
+    --annotations=<annotations>         number of tracked neuron annotations mapped to names. [default: 1000000]
+    --repeat=<repeat>                   number of timed repetitions, the best one is reported. [default: 3]
+    --scales=<scales>                   comma-separated synthetic file scales (small, medium, large) to time the
+                                        library routines at, empty to skip them. [default: small,medium]
+    --frames=<frames>                   number of frames in the long synthetic recording plot_activity is timed on.
+                                        [default: 20000]
+    --stimuli=<stimuli>                 number of stimulus events in the long synthetic recording. [default: 2000]
+    --track-frames=<track-frames>       number of frames of the long synthetic tracking reference the track queries are
+                                        timed on, 0 to skip it. [default: 4000]
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import h5py
+import matplotlib
+import numpy as np
+from docopt import docopt
+
+matplotlib.use('Agg')
+# visualize() hands imshow raw uint16 frames, which would log a clipping warning for every video frame.
+logging.getLogger('matplotlib.image').setLevel(logging.ERROR)
+
+import matplotlib.animation as animation
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from pynwb import NWBHDF5IO
+
+from . import h5_validation
+from .fixer import fix_subject, fix_track, worldline_name_codes
+from .helper import decode_strings, voxel_mask_array
+from .multiscale import export_file
+from .neurons import (FRAME_INDEX_MEMO, NAME_TABLE_MEMO, NEURON_INDEX_MEMO, TRAJECTORY_SCAN_MEMO, decode_names,
+                      tracks_at, trajectory)
+from .synthetic import SCALES, neuron_names, write_synthetic_nwb, write_synthetic_reference, write_synthetic_scale
+from .validation import validate
+from .visualizer import PYRAMID_MEMO, gamma_correct, generate_mip, plot_activity, stimulus_label_strip, visualize
+
+VOXEL_MASK_DTYPE = np.dtype([('x', '<u4'), ('y', '<u4'), ('z', '<u4'), ('weight', '<f4')])
+
+SYNTHETIC_NAME = 'sub-20240101-h1_synthetic.nwb'
+TRACK_WINDOW = 10
+
+
+def time_call(func, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def print_comparison(name, before, after):
+    print(f"{name}: {before * 1e3:.1f} ms -> {after * 1e3:.1f} ms ({before / max(after, 1e-12):.1f}x)")
+
+
+def print_timing(name, elapsed):
+    print(f"{name}: {elapsed * 1e3:.1f} ms")
+
+
+def print_memory_comparison(name, before, after):
+    print(f"{name}: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB peak")
+
+
+def benchmark_voxel_mask(n_rois, repeat):
+    rng = np.random.default_rng(0)
+    voxel_mask = np.zeros(n_rois, dtype=VOXEL_MASK_DTYPE)
+    for field in ['x', 'y', 'z']:
+        voxel_mask[field] = rng.integers(0, 512, n_rois)
+    voxel_mask['weight'] = 1.0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with h5py.File(os.path.join(tmp_dir, 'voxel_mask.h5'), 'w') as h5_file:
+            dataset = h5_file.create_dataset('voxel_mask', data=voxel_mask)
+
+            before = time_call(lambda: np.array(dataset[:].tolist()), repeat)
+            after = time_call(lambda: voxel_mask_array(dataset), repeat)
+            print_comparison(f"voxel_mask_array ({n_rois} rows)", before, after)
+
+            before = time_call(lambda: np.array(dataset[:].tolist())[:, :2], repeat)
+            after = time_call(lambda: voxel_mask_array(dataset, fields=['x', 'y']), repeat)
+            print_comparison(f"voxel_mask_array x/y only ({n_rois} rows)", before, after)
+
+
+def float_gamma_correct(channel_data, gamma):
+    channel_data = channel_data.astype(float)
+    max_val = channel_data.max() if channel_data.max() != 0 else 1
+    channel_data /= max_val
+    channel_data = np.power(channel_data, 1.0 / gamma)
+    channel_data *= max_val
+    return channel_data
+
+
+def benchmark_gamma(repeat):
+    rng = np.random.default_rng(0)
+    for dtype in [np.uint16, np.float32]:
+        channel_data = (rng.random((1024, 256)) * 4095).astype(dtype)
+        before = time_call(lambda: float_gamma_correct(channel_data, 0.8), repeat)
+        after = time_call(lambda: gamma_correct(channel_data, 0.8), repeat)
+        print_comparison(f"gamma_correct ({np.dtype(dtype).name} 1024x256)", before, after)
+
+
+def benchmark_worldline_mapping(n_annotations, repeat):
+    rng = np.random.default_rng(0)
+    worldline_ids = rng.permutation(300)
+    worldline_names = np.array(neuron_names(300))
+    annotation_ids = rng.choice(worldline_ids, n_annotations)
+
+    id_to_name = dict(zip(worldline_ids, worldline_names))
+    before = time_call(lambda: [id_to_name[wl_id] for wl_id in annotation_ids], repeat)
+    after = time_call(lambda: worldline_name_codes(worldline_ids, worldline_names, annotation_ids), repeat)
+    print_comparison(f"worldline names ({n_annotations} annotations)", before, after)
+
+    # File sizes of neuron_id stored as one string per annotation and as codes into the distinct names.
+    names, codes = worldline_name_codes(worldline_ids, worldline_names, annotation_ids)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with h5py.File(os.path.join(tmp_dir, 'strings.h5'), 'w') as h5_file:
+            h5_file.create_dataset('neuron_id', data=names[codes].astype(object), dtype=h5py.string_dtype())
+        with h5py.File(os.path.join(tmp_dir, 'codes.h5'), 'w') as h5_file:
+            h5_file.create_dataset('neuron_id', data=codes)
+            h5_file.create_dataset('name', data=names.astype(object), dtype=h5py.string_dtype())
+
+        print(f"neuron_id file size ({n_annotations} annotations): "
+              f"{os.path.getsize(os.path.join(tmp_dir, 'strings.h5')) / 1e6:.1f} MB -> "
+              f"{os.path.getsize(os.path.join(tmp_dir, 'codes.h5')) / 1e6:.1f} MB")
+
+
+def plot_activity_figure(nwbfile):
+    fig = plt.figure(figsize=(5, 5))
+    plot_activity(fig.add_subplot(), nwbfile)
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+def axvspan_activity_axis(ax, fluo, stimulus_labels, stimulus_timestamps, stimulus_colors, num_frames):
+    for i in range(len(stimulus_labels)):
+        end = stimulus_timestamps[i + 1] if i < len(stimulus_labels) - 1 else num_frames
+        ax.axvspan(stimulus_timestamps[i], end, facecolor=stimulus_colors[stimulus_labels[i]], alpha=0.4)
+    ax.plot(fluo, linewidth=0.5, c='r')
+    ax.set_ylim(0, np.max([x for x in fluo if not np.isnan(x)]) + 5)
+
+
+def strip_activity_axis(ax, fluo, stimulus_labels, stimulus_timestamps, stimulus_colors, num_frames):
+    ax.add_collection(LineCollection([np.column_stack([np.arange(len(fluo)), fluo])], linewidths=0.5, colors='r'))
+    ax.set_ylim(0, np.nanmax(fluo) + 5)
+    strip_edges, strip_colors = stimulus_label_strip(stimulus_labels, stimulus_timestamps, stimulus_colors, num_frames)
+    ax.pcolorfast(strip_edges, ax.get_ylim(), strip_colors, rasterized=True, zorder=0).sticky_edges.x.clear()
+    ax.autoscale_view(scaley=False)
+
+
+def draw_activity_axis(draw_axis, *args):
+    fig = plt.figure(figsize=(5, 5))
+    draw_axis(fig.add_subplot(), *args)
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+def benchmark_activity(n_frames, n_stimuli, repeat):
+    rng = np.random.default_rng(0)
+    fluo = rng.random(n_frames) * 100
+    fluo[rng.choice(n_frames, n_frames // 100, replace=False)] = np.nan
+    stimulus_timestamps = np.sort(rng.choice(n_frames, n_stimuli, replace=False)).astype(float)
+    stimulus_labels = np.array([f"stimulus{i % 3}" for i in range(n_stimuli)])
+    cmap = plt.get_cmap('tab10', 3)
+    stimulus_colors = {label: cmap(i) for i, label in enumerate(np.unique(stimulus_labels))}
+
+    args = (fluo, stimulus_labels, stimulus_timestamps, stimulus_colors, n_frames)
+    before = time_call(lambda: draw_activity_axis(axvspan_activity_axis, *args), repeat)
+    after = time_call(lambda: draw_activity_axis(strip_activity_axis, *args), repeat)
+    print_comparison(f"activity axis ({n_frames} frames, {n_stimuli} stimuli)", before, after)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Tiny volumes, so writing the file costs next to nothing next to the recording's length.
+        filepath = os.path.join(tmp_dir, SYNTHETIC_NAME)
+        write_synthetic_nwb(filepath, neuropal_shape=(5, 4, 16, 16), calcium_shape=(n_frames, 4, 4, 2, 3),
+                            n_neurons=20, n_tracks=20, n_stimuli=n_stimuli)
+        with NWBHDF5IO(filepath, mode='r') as read_io:
+            nwbfile = read_io.read()
+            print_timing(f"plot_activity ({n_frames} frames, {n_stimuli} stimuli)",
+                         time_call(lambda: plot_activity_figure(nwbfile), repeat, setup=PYRAMID_MEMO.clear))
+            print_timing(f"plot_activity ({n_frames} frames, {n_stimuli} stimuli, memoized pyramid)",
+                         time_call(lambda: plot_activity_figure(nwbfile), repeat))
+
+
+def visualize_in(nwbfile, output_dir):
+    # visualize() writes its video below the working directory.
+    cwd = os.getcwd()
+    os.chdir(output_dir)
+    try:
+        visualize(nwbfile)
+    finally:
+        os.chdir(cwd)
+        plt.close('all')
+
+
+def masked_track_window(annotations, start, stop):
+    frames = annotations['t_idx'][:]
+    in_window = (frames >= start) & (frames < stop)
+    return [annotations[axis][:][in_window] for axis in ['x', 'y', 'z']]
+
+
+def offset_track_window(module, start, stop):
+    first, last = module['TrackedNeuronFrames/start'][start], module['TrackedNeuronFrames/stop'][stop - 1]
+    return [module[f"TrackedNeurons/{axis}"][first:last] for axis in ['x', 'y', 'z']]
+
+
+def loaded_names(nwb_obj, table):
+    # Decoded on every call, as loading the whole table does.
+    return decode_strings(table['neuron_id'].table['neuron'].data[:])[table['neuron_id'].data[:]]
+
+
+def loaded_tracks(nwb_obj, table, rows):
+    # The whole table is loaded before the rows of interest are picked out of it.
+    names = loaded_names(nwb_obj, table)
+    positions = np.stack([table[axis].data[:] for axis in ['x', 'y', 'z']], axis=-1)
+    return table['t'].data[:][rows], names[rows], positions[rows]
+
+
+def benchmark_scale(scale, repeat):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filepath = os.path.join(tmp_dir, SYNTHETIC_NAME)
+        work_path = os.path.join(tmp_dir, 'work', SYNTHETIC_NAME)
+        os.makedirs(os.path.dirname(work_path))
+
+        start = time.perf_counter()
+        write_synthetic_scale(filepath, scale, reference=True)
+        print(f"\n{scale}: {SCALES[scale]} ({os.path.getsize(filepath) / 1e6:.0f} MB, "
+              f"written in {time.perf_counter() - start:.1f}s)")
+
+        with NWBHDF5IO(filepath, mode='r') as read_io:
+            nwbfile = read_io.read()
+            print_timing(f"{scale} validate", time_call(lambda: validate(nwbfile), repeat))
+            print_timing(f"{scale} generate_mip", time_call(lambda: generate_mip(nwbfile), repeat))
+            color_stack = nwbfile.acquisition['NeuroPALImageRaw'].data
+            print_memory_comparison(f"{scale} generate_mip", peak_memory(lambda: color_stack[:].max(axis=1)),
+                                    peak_memory(lambda: generate_mip(nwbfile, memory_budget=16 * 1024 * 1024)))
+            if export_file(filepath)['error'] is None:
+                output_size = (color_stack.shape[2] // 4, color_stack.shape[3] // 4)
+                print_comparison(f"{scale} generate_mip at {output_size[0]}x{output_size[1]}",
+                                 time_call(lambda: generate_mip(nwbfile), repeat),
+                                 time_call(lambda: generate_mip(nwbfile, output_size=output_size), repeat))
+            else:
+                print(f"{scale} generate_mip multiscale: skipped, zarr is not available")
+            print_timing(f"{scale} plot_activity", time_call(lambda: plot_activity_figure(nwbfile), repeat))
+            if animation.FFMpegWriter.isAvailable():
+                print_timing(f"{scale} visualize", time_call(lambda: visualize_in(nwbfile, tmp_dir), repeat))
+            else:
+                print(f"{scale} visualize: skipped, ffmpeg is not available")
+
+        with h5py.File(filepath, 'r') as h5_file:
+            print_timing(f"{scale} validate --fast", time_call(lambda: h5_validation.validate(h5_file), repeat))
+
+        # The fixers rewrite their input, and fix_track exports an _updated copy, so each run starts from a fresh copy.
+        copy_file = lambda: shutil.copyfile(filepath, work_path)
+        print_comparison(f"{scale} fix_subject in place",
+                         time_call(lambda: fix_subject(work_path, strain='OH15500', export=True), repeat,
+                                   setup=copy_file),
+                         time_call(lambda: fix_subject(work_path, strain='OH15500'), repeat, setup=copy_file))
+        print_timing(f"{scale} fix_track", time_call(lambda: fix_track(work_path, 'maedeh', reference_path=tmp_dir),
+                                                    repeat, setup=copy_file))
+
+        compare_track_queries(scale, fix_track(work_path, 'maedeh', reference_path=tmp_dir), tmp_dir, repeat)
+
+
+def compare_track_queries(label, updated_path, reference_path, repeat):
+    # Tracks of a window of frames, masked out of the unsorted annotations or sliced by the frame offsets.
+    with h5py.File(os.path.join(reference_path, 'annotations.h5'), 'r') as annotations, \
+            h5py.File(updated_path, 'r') as h5_file:
+        frames = int(annotations['t_idx'][:].max()) // 2
+        print_comparison(f"{label} tracks of frames {frames}:{frames + TRACK_WINDOW}",
+                         time_call(lambda: masked_track_window(annotations, frames, frames + TRACK_WINDOW), repeat),
+                         time_call(lambda: offset_track_window(h5_file['processing/NeuroPAL'], frames,
+                                                               frames + TRACK_WINDOW), repeat))
+
+    # Each query builds its index from scratch, as the first query on a newly opened file does.
+    with NWBHDF5IO(updated_path, mode='r') as read_io:
+        nwbfile = read_io.read()
+        table = nwbfile.processing['NeuroPAL']['TrackedNeurons']
+        neuron = decode_names(nwbfile, table, table['neuron_id'].data[:1])[0]
+        clear_indexes = lambda: (NEURON_INDEX_MEMO.clear(), FRAME_INDEX_MEMO.clear(), NAME_TABLE_MEMO.clear(),
+                                 TRAJECTORY_SCAN_MEMO.clear())
+        print_comparison(f"{label} tracks_at",
+                         time_call(lambda: loaded_tracks(nwbfile, table, table['t'].data[:] == frames), repeat),
+                         time_call(lambda: tracks_at(nwbfile, frames), repeat, setup=clear_indexes))
+        print_comparison(f"{label} trajectory",
+                         time_call(lambda: loaded_tracks(nwbfile, table, loaded_names(nwbfile, table) == neuron),
+                                   repeat),
+                         time_call(lambda: trajectory(nwbfile, neuron), repeat, setup=clear_indexes))
+
+
+def benchmark_tracks(n_frames, n_tracks, repeat):
+    # The synthetic scales track too few annotations for chunked TrackedNeurons columns, so the track queries are
+    # also timed on a long tracking reference.
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filepath = os.path.join(tmp_dir, SYNTHETIC_NAME)
+        write_synthetic_nwb(filepath, neuropal_shape=(5, 4, 16, 16), calcium_shape=(4, 4, 4, 2, 3), n_neurons=20,
+                            n_tracks=20, n_stimuli=2)
+        write_synthetic_reference(tmp_dir, n_tracks=n_tracks, n_frames=n_frames)
+        print()
+        compare_track_queries(f"tracks ({n_tracks * n_frames} annotations)",
+                              fix_track(filepath, 'maedeh', reference_path=tmp_dir), tmp_dir, repeat)
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__, version='Support Library Benchmarks')
+
+    benchmark_voxel_mask(int(args['--rois']), int(args['--repeat']))
+    benchmark_gamma(int(args['--repeat']))
+    benchmark_worldline_mapping(int(args['--annotations']), int(args['--repeat']))
+    benchmark_activity(int(args['--frames']), int(args['--stimuli']), int(args['--repeat']))
+    if int(args['--track-frames']):
+        benchmark_tracks(int(args['--track-frames']), SCALES['large']['n_tracks'], int(args['--repeat']))
+    for scale in filter(None, args['--scales'].split(',')):
+        benchmark_scale(scale, int(args['--repeat']))
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+import h5py
+
+DEFAULT_CACHE_NAME = '.nwb_validation_cache.sqlite'
+
+CACHE_COLUMNS = ['path', 'size', 'mtime', 'fingerprint', 'ruleset', 'is_valid', 'summary', 'issues']
+# Each file holds one result per ruleset, so runs with different options never evict each other's results.
+CACHE_KEY = ['path', 'ruleset']
+
+# Datasets in /general smaller than this are hashed by value, larger ones by shape and dtype only.
+FINGERPRINT_VALUE_BYTES = 64 * 1024
+
+
+def fingerprint(filepath):
+    digest = hashlib.sha1()
+
+    def hash_structure(name, obj, hash_values):
+        digest.update(name.encode('utf-8'))
+        if isinstance(obj, h5py.Dataset):
+            digest.update(f"{obj.shape}{obj.dtype}".encode('utf-8'))
+            if hash_values and obj.size * obj.dtype.itemsize <= FINGERPRINT_VALUE_BYTES:
+                digest.update(repr(obj[()]).encode('utf-8'))
+
+    with h5py.File(filepath, 'r') as h5_file:
+        for group_name, hash_values in [('general', True), ('acquisition', False), ('processing', False)]:
+            if group_name in h5_file:
+                digest.update(group_name.encode('utf-8'))
+                h5_file[group_name].visititems(lambda name, obj: hash_structure(name, obj, hash_values))
+
+    return digest.hexdigest()
+
+
+def file_key(filepath):
+    stat = os.stat(filepath)
+    return stat.st_size, stat.st_mtime, fingerprint(filepath)
+
+
+class ValidationCache:
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.connection = sqlite3.connect(cache_path)
+
+        # The cache is disposable, so a table written by an older layout is simply rebuilt.
+        table_info = list(self.connection.execute("PRAGMA table_info(results)"))
+        columns = [row[1] for row in table_info]
+        key = [row[1] for row in sorted((row for row in table_info if row[5]), key=lambda row: row[5])]
+        if columns and (columns != CACHE_COLUMNS or key != CACHE_KEY):
+            self.connection.execute("DROP TABLE results")
+
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "path TEXT, size INTEGER, mtime REAL, fingerprint TEXT, ruleset TEXT, "
+            "is_valid INTEGER, summary TEXT, issues TEXT, PRIMARY KEY (path, ruleset))"
+        )
+        self.connection.commit()
+
+    def cached_fingerprint(self, filepath, ruleset):
+        # Fingerprint of the cached result when the file's size and mtime are unchanged, so only those files have to
+        # be fingerprinted again before the result is reused.
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+
+        row = self.connection.execute(
+            "SELECT fingerprint FROM results WHERE path = ? AND size = ? AND mtime = ? AND ruleset = ?",
+            (os.path.abspath(filepath), stat.st_size, stat.st_mtime, ruleset)
+        ).fetchone()
+
+        return None if row is None else row[0]
+
+    def lookup(self, filepath, key, ruleset):
+        row = self.connection.execute(
+            "SELECT size, mtime, fingerprint, is_valid, summary, issues FROM results WHERE path = ? AND ruleset = ?",
+            (os.path.abspath(filepath), ruleset)
+        ).fetchone()
+
+        if row is None or tuple(row[:3]) != tuple(key):
+            return None
+
+        return bool(row[3]), row[4], json.loads(row[5])
+
+    def store(self, filepath, key, ruleset, is_valid, summary, issues):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (os.path.abspath(filepath), *key, ruleset, int(is_valid), summary, json.dumps(issues))
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,231 @@
+"""
+corpus.py: Validates every NWB file within a directory tree across a pool of worker processes.
+
+<path> may also be an fsspec URL (e.g. https://... or s3://...), in which case files are streamed through a block cache
+tuned for HDF5 metadata and the bytes fetched per file are reported.
+
+A file is reported valid when none of its issues has error severity. Every rule reports errors unless the profile lowers
+its severity to warning, which lists its issues without failing the file.
+
+Usage:
+    corpus.py -h | --help
+    corpus.py <path> [options]
+
+Options:
+    -h --help                           show this message and exit.
+    --workers=<workers>                 number of worker processes, 0 uses every available core. [default: 0]
+    --fast                              skip building the pynwb object graph, the same rules run over the raw HDF5 file.
+    --cache=<cache>                     path to the validation result cache, defaults to a file within <path>; unused for URLs.
+    --no-cache                          re-validate every file without reading or updating the cache.
+    --profile=<profile>                 validation profile name or path to a YAML profile. [default: default]
+    --report=<report>                   write one issue record per line to a .jsonl or .parquet report.
+    --fail-fast                         stop validating each file at its first error, running the cheapest checks first.
+    --timings                           record wall time and bytes read per rule and print the costliest rules,
+                                        always re-validates every file with the raw h5py backend.
+    --quiet                             only print the final summary.
+"""
+
+import os
+import time
+
+from docopt import docopt
+from pynwb import NWBHDF5IO
+
+from . import h5_validation
+from .cache import DEFAULT_CACHE_NAME, ValidationCache, file_key
+from .helper import print_status, run_pool
+from .remote import file_size, is_url, list_remote_files, open_h5
+from .report import open_report
+from .rules import merge_timings
+from .validation import Issue, iter_issues, ruleset_version, summarize
+
+
+def list_nwb_files(path):
+    if is_url(path):
+        return list_remote_files(path)
+
+    nwb_files = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            if filename.endswith(".nwb"):
+                nwb_files.append(os.path.join(dirpath, filename))
+
+    return sorted(nwb_files)
+
+
+def validate_file(filepath, fast=False, profile=None, fail_fast=False, timings=False):
+    start = time.perf_counter()
+    result = {'file': filepath, 'size': 0, 'is_valid': False, 'summary': '', 'issues': [], 'error': None,
+              'cached': False, 'bytes_fetched': None, 'timings': {} if timings else None}
+
+    try:
+        result['size'] = file_size(filepath)
+        with open_h5(filepath, count_reads=timings) as (h5_file, read_counter):
+            if fast:
+                issues = list(h5_validation.iter_issues(h5_file, file=filepath, profile=profile, fail_fast=fail_fast,
+                                                        timings=result['timings'], read_counter=read_counter))
+            else:
+                with NWBHDF5IO(file=h5_file, mode='r') as read_io:
+                    nwbfile = read_io.read()
+                    issues = list(iter_issues(nwbfile, file=filepath, profile=profile, fail_fast=fail_fast))
+
+            if read_counter is not None:
+                result['bytes_fetched'] = read_counter.total_requested_bytes
+
+        result['is_valid'], result['summary'] = summarize(issues, fail_fast)
+        result['issues'] = [issue._asdict() for issue in issues]
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        result['issues'] = [Issue(filepath, None, None, 'file.unreadable', 'error', result['error'])._asdict()]
+
+    result['elapsed'] = time.perf_counter() - start
+    return result
+
+
+def validate_directory(path, workers=None, fast=False, cache=None, profile=None, fail_fast=False, timings=False):
+    nwb_files = list_nwb_files(path)
+    # Fail-fast results only hold the first issue, and each backend reports its own issues, so both are cached apart.
+    ruleset = ruleset_version(profile) + ('-fast' if fast else '-pynwb') + ('-fail-fast' if fail_fast else '')
+
+    validation_cache = ValidationCache(cache) if cache else None
+    try:
+        # Only the cache's own rows are read here, files are fingerprinted by the workers.
+        fingerprints = None
+        if validation_cache is not None:
+            fingerprints = {filepath: validation_cache.cached_fingerprint(filepath, ruleset) for filepath in nwb_files
+                            if not is_url(filepath)}
+
+        for result in validate_files(nwb_files, workers, fast, profile, fail_fast, timings, fingerprints):
+            key = result.pop('key', None)
+            if result['cached']:
+                result = cached_result(validation_cache, result['file'], key, ruleset) or \
+                    validate_file(result['file'], fast, profile, fail_fast, timings)
+            elif validation_cache is not None and result['error'] is None and key is not None:
+                validation_cache.store(result['file'], key, ruleset, result['is_valid'], result['summary'],
+                                       result['issues'])
+
+            yield result
+    finally:
+        if validation_cache is not None:
+            validation_cache.close()
+
+
+def cached_result(validation_cache, filepath, key, ruleset):
+    cached = validation_cache.lookup(filepath, key, ruleset)
+    if cached is None:
+        return None
+
+    return {'file': filepath, 'size': key[0], 'is_valid': cached[0], 'summary': cached[1], 'issues': cached[2],
+            'error': None, 'cached': True, 'bytes_fetched': None, 'timings': None, 'elapsed': 0.0}
+
+
+def validate_keyed_file(filepath, cached_fingerprint, fast, profile, fail_fast=False, timings=False):
+    # Fingerprints the file and validates it only when it no longer matches its cached result, leaving the key for
+    # the caller to look the result up or store it under.
+    try:
+        key = file_key(filepath)
+    except OSError:
+        key = None
+
+    if key is not None and cached_fingerprint is not None and key[2] == cached_fingerprint:
+        return {'file': filepath, 'key': key, 'cached': True}
+
+    return {**validate_file(filepath, fast, profile, fail_fast, timings), 'key': key}
+
+
+def iter_directory_issues(path, workers=None, fast=False, cache=None, profile=None, fail_fast=False):
+    for result in validate_directory(path, workers=workers, fast=fast, cache=cache, profile=profile,
+                                     fail_fast=fail_fast):
+        yield from result['issues']
+
+
+def validate_files(nwb_files, workers, fast, profile, fail_fast=False, timings=False, fingerprints=None):
+    # Each task opens its own file handle inside the worker, so no HDF5 state crosses process boundaries. Files with
+    # an entry in fingerprints, including None for files the cache has no result for, are fingerprinted in the worker.
+    fingerprints = fingerprints if fingerprints is not None else {}
+    tasks = [(filepath, filepath in fingerprints, fingerprints.get(filepath), fast, profile, fail_fast, timings)
+             for filepath in nwb_files]
+    return run_pool(validate_task, tasks, workers)
+
+
+def validate_task(filepath, keyed, cached_fingerprint, fast, profile, fail_fast=False, timings=False):
+    if keyed:
+        return validate_keyed_file(filepath, cached_fingerprint, fast, profile, fail_fast, timings)
+
+    return validate_file(filepath, fast, profile, fail_fast, timings)
+
+
+def print_result(n, result):
+    if result['error'] is not None:
+        print_status(n, result['file'], f"ERROR: {result['error']}")
+        return
+
+    timing = 'cached' if result['cached'] else f"{result['elapsed']:.1f}s"
+    if result['bytes_fetched'] is not None:
+        timing += f", {result['bytes_fetched'] / 1e6:.2f} of {result['size'] / 1e6:.2f} MB read"
+    print_status(n, result['file'], f"Validation {'PASSED' if result['is_valid'] else 'FAILED'} ({timing}):")
+    print(f"{n} | | " + result['summary'].replace('\n', f'\n{n} | |'))
+
+
+def update_totals(totals, result):
+    totals['files'] += 1
+    totals['valid'] += result['is_valid']
+    totals['unreadable'] += result['error'] is not None
+    totals['cached'] += result['cached']
+    totals['bytes'] += result['size']
+    totals['fetched'] += result['bytes_fetched'] or 0
+    merge_timings(totals['timings'], result['timings'] or {})
+
+
+def print_throughput(totals, elapsed):
+    total_files = totals['files']
+    valid_files = totals['valid']
+    failed_reads = totals['unreadable']
+    cached_files = totals['cached']
+    total_bytes = totals['bytes']
+
+    print(f"\n{valid_files}/{total_files} ({(valid_files / max(total_files, 1)) * 100:.1f}%) valid, {failed_reads} unreadable, {cached_files} cached.")
+    if totals['fetched']:
+        print(f"Read {totals['fetched'] / 1e6:.2f} of {total_bytes / 1e6:.2f} MB.")
+    print(f"Validated {total_files} files ({total_bytes / 1e9:.2f} GB) in {elapsed:.1f}s: "
+          f"{total_files / max(elapsed, 1e-9):.2f} files/s, {total_bytes / 1e6 / max(elapsed, 1e-9):.1f} MB/s.")
+
+
+def print_timings(timings):
+    print(f"\n{'Rule':<32}{'Seconds':>10}{'MB read':>10}")
+    for rule_id, (seconds, bytes_read) in sorted(timings.items(), key=lambda item: item[1][0], reverse=True):
+        print(f"{rule_id:<32}{seconds:>10.3f}{bytes_read / 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__, version='NWB Corpus Validator')
+
+    # Per-rule timings are only recorded by the rule engine behind --fast.
+    fast = args['--fast'] or args['--timings']
+
+    cache = None
+    # Remote files have no reliable mtime to key the cache on, so URLs are always re-validated.
+    if not args['--no-cache'] and not args['--timings'] and not is_url(args['<path>']):
+        cache = args['--cache'] or os.path.join(args['<path>'], DEFAULT_CACHE_NAME)
+
+    report = open_report(args['--report']) if args['--report'] else None
+
+    # Only running totals are kept, so memory stays flat no matter how many files the corpus holds.
+    start = time.perf_counter()
+    totals = {'files': 0, 'valid': 0, 'unreadable': 0, 'cached': 0, 'bytes': 0, 'fetched': 0, 'timings': {}}
+    try:
+        for result in validate_directory(args['<path>'], workers=int(args['--workers']), fast=fast, cache=cache,
+                                         profile=args['--profile'], fail_fast=args['--fail-fast'],
+                                         timings=args['--timings']):
+            update_totals(totals, result)
+            if report is not None:
+                report.write(result['issues'])
+            if not args['--quiet']:
+                print_result(totals['files'], result)
+    finally:
+        if report is not None:
+            report.close()
+
+    print_throughput(totals, time.perf_counter() - start)
+    if args['--timings']:
+        print_timings(totals['timings'])
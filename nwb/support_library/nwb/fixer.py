@@ -20,7 +20,7 @@ from hdmf.backends.hdf5.h5_utils import H5DataIO
 from hdmf.data_utils import DataChunkIterator
 from ndx_multichannel_volume import CElegansSubject, OpticalChannelReferences, OpticalChannelPlus, ImagingVolume, \
     MultiChannelVolume, MultiChannelVolumeSeries, SegmentationLabels
-from pynwb import NWBFile, NWBHDF5IO
+from pynwb import NWBFile, NWBHDF5IO, get_type_map
 from pynwb.behavior import SpatialSeries, Position, BehavioralTimeSeries, BehavioralEvents
 from pynwb.ophys import ImageSegmentation, PlaneSegmentation, \
     DfOverF, RoiResponseSeries, Fluorescence
@@ -32,120 +32,187 @@ import nd2reader
 import nrrd
 from pathlib import Path
 
-from hdmf.common import VectorData, VectorIndex
+from hdmf.common import DynamicTableRegion, VectorData, VectorIndex
 from pynwb.core import DynamicTable
 
 from support_library.nwb.validation import validate
 from support_library.nwb.visualizer import visualize
-from support_library.nwb.helper import maedeh_decode_subject
+from support_library.nwb.helper import decode_strings, maedeh_decode_subject, record_modification, scalar_value, \
+    write_scalar
+
+# Sources of tracking annotations fix_track can rebuild TrackedNeurons from.
+TRACK_REFERENCES = ['maedeh']
+# Rows per chunk of the time-sorted TrackedNeurons columns, a few dozen frames of a typical recording.
+TRACK_CHUNK_ROWS = 8192
+# Columns of at most this many rows are written contiguous and uncompressed, as reading them whole costs less than
+# decompressing even the few chunks a window of frames spans.
+TRACK_CONTIGUOUS_ROWS = 65536
+# HDF5 dtypes of the spec dtypes fix_subject can create a missing subject field with.
+SPEC_DTYPES = {'text': h5py.string_dtype(), 'isodatetime': h5py.string_dtype(), 'float32': np.dtype(np.float32),
+               'float': np.dtype(np.float32), 'float64': np.dtype(np.float64), 'int32': np.dtype(np.int32)}
 
 
 def fix_subject(filepath,
                 subject_id=None, description=None,
                 sex=None, species=None, strain=None,
                 date_of_birth=None, growth_stage=None, growth_stage_time=None,
-                cultivation_temp=None):
-
-    with h5py.File(filepath, "r+") as f:
-        if subject_id is not None:
-            dataset = f['general']['subject']['subject_id']
-            dataset[...] = np.array(subject_id, dtype="S")
-
-        if description is not None:
-            dataset = f['general']['subject']['description']
-
-            original_value = dataset
-            if isinstance(original_value, bytes):
-                original_value = original_value.decode('utf-8')
-
-            dataset[...] = np.array(description, dtype="S")
-
-        if sex is not None:
-            dataset = f['general']['subject']['sex']
-            dataset[...] = np.array(sex, dtype="S")
+                cultivation_temp=None, export=False):
 
-        if species is not None:
-            dataset = f['general']['subject']['species']
-            dataset[...] = np.array(species, dtype="S")
+    fields = {'subject_id': subject_id, 'description': description, 'sex': sex, 'species': species, 'strain': strain,
+              'date_of_birth': date_of_birth, 'growth_stage': growth_stage, 'growth_stage_time': growth_stage_time,
+              'cultivation_temp': cultivation_temp}
 
-        if strain is not None:
-            dataset = f['general']['subject']['strain']
-            dataset[...] = np.array(strain, dtype="S")
-
-        if date_of_birth is not None:
-            dataset = f['general']['subject']['date_of_birth']
-            dataset[...] = np.array(date_of_birth, dtype="S")
-
-        if growth_stage is not None:
-            dataset = f['general']['subject']['growth_stage']
-            dataset[...] = np.array(growth_stage, dtype="S")
+    # Patched in place, so only the subject fields and file_create_date are rewritten however large the file is.
+    patched = {name: value for name, value in fields.items() if value is not None}
+    with h5py.File(filepath, "r+") as f:
+        subject = f['general']['subject']
+        spec_fields = subject_spec_fields()
+        # Fields that are missing and cannot be typed from the spec are left to the export below.
+        unpatched = {name: value for name, value in patched.items()
+                     if name not in subject and name not in subject.attrs and spec_fields.get(name) is None}
+        for name, value in patched.items():
+            if name in unpatched:
+                continue
+
+            dtype, is_attribute = spec_fields.get(name) or (None, False)
+            if is_attribute:
+                subject.attrs[name] = scalar_value(value, dtype)
+            else:
+                write_scalar(subject, name, value, dtype)
 
-        if growth_stage_time is not None:
-            dataset = f['general']['subject']['growth_stage_time']
-            dataset[...] = np.array(growth_stage_time, dtype="S")
+        if len(patched) > len(unpatched):
+            record_modification(f)
 
-        if cultivation_temp is not None:
-            dataset = f['general']['subject']['cultivation_temp']
-            dataset[...] = np.array(cultivation_temp, dtype="S")
+    if not export and not unpatched:
+        return
 
+    # Exported to <file>_updated.nwb, or over the file itself when only export can set the unpatched fields.
+    export_path = filepath.replace('.nwb', '_updated.nwb') if export else f"{filepath}.export"
     with NWBHDF5IO(filepath, mode='r') as read_io:
         nwbfile = read_io.read()
+        for name, value in unpatched.items():
+            setattr(nwbfile.subject, name, value)
+        if unpatched:
+            nwbfile.subject.set_modified()
         nwbfile.set_modified()
 
-        with NWBHDF5IO(filepath.replace('.nwb', '_updated.nwb'), mode='w') as export_io:
+        with NWBHDF5IO(export_path, mode='w') as export_io:
             export_io.export(src_io=read_io, nwbfile=nwbfile)
 
+    if not export:
+        os.replace(export_path, filepath)
+
+
+def subject_spec_fields():
+    # (HDF5 dtype, whether it is an attribute) of each scalar CElegansSubject field whose spec dtype is known.
+    spec = get_type_map().namespace_catalog.get_spec(CElegansSubject.namespace, CElegansSubject.__name__)
+    fields = {attribute.name: (SPEC_DTYPES[attribute.dtype], True) for attribute in spec.attributes
+              if attribute.shape is None and attribute.dtype in SPEC_DTYPES}
+    fields.update({dataset.name: (SPEC_DTYPES[dataset.dtype], False) for dataset in spec.datasets
+                   if dataset.shape is None and dataset.dtype in SPEC_DTYPES})
+    return fields
+
+
+def worldline_name_codes(worldline_ids, worldline_names, annotation_ids):
+    # Distinct names and, for each annotation, the smallest unsigned integer code of its worldline's name.
+    names, name_codes = np.unique(worldline_names, return_inverse=True)
+    worldline_order = np.argsort(worldline_ids)
+    worldline_rows = worldline_order[np.minimum(np.searchsorted(worldline_ids, annotation_ids, sorter=worldline_order),
+                                                len(worldline_ids) - 1)]
+    unnamed = worldline_ids[worldline_rows] != annotation_ids
+    if unnamed.any():
+        raise KeyError(f"Worldline {annotation_ids[unnamed][0]} has no entry in worldlines.h5")
+
+    return names, name_codes[worldline_rows].astype(np.min_scalar_type(max(len(names) - 1, 0)))
+
+
+def track_column(data):
+    # Chunked and compressed so that reading a range of frames decompresses only the chunks holding them.
+    if len(data) <= TRACK_CONTIGUOUS_ROWS:
+        return data
+
+    return H5DataIO(data, chunks=(min(TRACK_CHUNK_ROWS, len(data)),), compression='gzip', compression_opts=4,
+                    shuffle=True)
+
+
+def tracked_neurons_table(reference_path):
+    with h5py.File(os.path.join(reference_path, 'annotations.h5'), "r") as annotations:
+        with h5py.File(os.path.join(reference_path, 'worldlines.h5'), "r") as worldlines:
+            worldline_ids = worldlines['id'][:]
+            worldline_names = decode_strings(worldlines['name'][:])
+            annotation_ids = annotations['worldline_id'][:]
+            frames = annotations['t_idx'][:]
+
+            # Rows are sorted by frame, then worldline, so each frame is one contiguous run of rows.
+            order = np.lexsort((annotation_ids, frames))
+            annotation_ids = annotation_ids[order]
+            frames = frames[order]
+
+            x_coords = VectorData(
+                name='x', description='X-coordinate',
+                data=track_column(annotations['x'][:][order]))
+
+            y_coords = VectorData(
+                name='y', description='Y-coordinate',
+                data=track_column(annotations['y'][:][order]))
+
+            z_coords = VectorData(
+                name='z', description='Z-coordinate',
+                data=track_column(annotations['z'][:][order]))
+
+            t_coords = VectorData(
+                name='t', description='Frame',
+                data=track_column(frames))
+
+    # Each name is stored once in TrackedNeuronNames, and each annotation references the row of its worldline's name.
+    names, codes = worldline_name_codes(worldline_ids, worldline_names, annotation_ids)
+    names_table = DynamicTable(name='TrackedNeuronNames',
+                               description='Names of the neurons tracked in TrackedNeurons, one row per neuron.',
+                               columns=[VectorData(name='neuron', description='Name of the neuron', data=names)])
+    n_ids = DynamicTableRegion(name='neuron_id', description='Row of the neuron name in TrackedNeuronNames',
+                               data=track_column(codes), table=names_table)
+
+    roi_table = DynamicTable(name='TrackedNeurons',
+                             description='An (x, y, z, t, id) table of all neurons tracked throughout calcium image '
+                                         'series, sorted by frame.',
+                             columns=[x_coords, y_coords, z_coords, t_coords, n_ids],
+                             id=track_column(np.arange(len(frames))))
+
+    # Frame t occupies rows start[t]:stop[t] of TrackedNeurons.
+    offsets = np.searchsorted(frames, np.arange(frames.max() + 2 if len(frames) else 1)).astype(np.uint64)
+    frame_table = DynamicTable(name='TrackedNeuronFrames',
+                               description='Range of TrackedNeurons rows holding each frame, one row per frame.',
+                               columns=[VectorData(name='start', description='First row of the frame',
+                                                   data=offsets[:-1]),
+                                        VectorData(name='stop', description='Row after the last row of the frame',
+                                                   data=offsets[1:])])
+
+    return roi_table, names_table, frame_table
+
+
+def fix_track(filepath, reference, reference_path=None, output_path=None):
+    if reference not in TRACK_REFERENCES:
+        print(f"Reference {reference} has not associated fix routine.")
+        return None
 
-def fix_track(filepath, reference):
-    if reference == 'maedeh':
+    if reference_path is None:
         reference_date, reference_run = maedeh_decode_subject(filepath)
         reference_path = f"E:\\0-WORK\\1-UMASSCHAN\\Data\\venkatachalam\\maedeh_onedrive\\{reference_date}\\hermaphrodite\\{reference_run}"
 
-        with h5py.File(os.path.join(reference_path, 'annotations.h5'), "r") as annotations:
-            with h5py.File(os.path.join(reference_path, 'worldlines.h5'), "r") as worldlines:
-                all_wlids = worldlines['id'][:]
-                annotation_count = annotations['x'].shape[0]
-
-                x_coords = VectorData(
-                    name='x', description='X-coordinate',
-                    data=annotations['x'][:])
-
-                y_coords = VectorData(
-                    name='y', description='Y-coordinate',
-                    data=annotations['y'][:])
-
-                z_coords = VectorData(
-                    name='z', description='Z-coordinate',
-                    data=annotations['z'][:])
-
-                t_coords = VectorData(
-                    name='t', description='Frame',
-                    data=annotations['t_idx'][:])
-
-                id_to_name = {
-                    wl_id: name.decode("utf-8") if hasattr(name, 'decode') else name
-                    for wl_id, name in zip(all_wlids, worldlines['name'][:])
-                }
-
-                n_ids = VectorData(
-                    name='neuron_id', description='Name of the neuron',
-                    data=[id_to_name[wl_id] for wl_id in annotations['worldline_id'][:]])
-
-                roi_table = DynamicTable(name='TrackedNeurons',
-                                         description='An (x, y, z, t, id) table of all neurons tracked throughout calcium image series.',
-                                         columns=[x_coords, y_coords, z_coords, t_coords, n_ids])
-
-                with NWBHDF5IO(filepath, mode='r') as read_io:
-                    nwbfile = read_io.read()
-                    nwbfile.processing['NeuroPAL'].data_interfaces.pop('TrackedNeurons')
-                    nwbfile.processing['NeuroPAL'].add(roi_table)
-                    nwbfile.set_modified()
+    tables = tracked_neurons_table(reference_path)
+    output_path = output_path or filepath.replace('.nwb', '_updated.nwb')
+    with NWBHDF5IO(filepath, mode='r') as read_io:
+        nwbfile = read_io.read()
+        for table in tables:
+            if table.name in nwbfile.processing['NeuroPAL'].data_interfaces:
+                nwbfile.processing['NeuroPAL'].data_interfaces.pop(table.name)
+            nwbfile.processing['NeuroPAL'].add(table)
+        nwbfile.set_modified()
 
-                    with NWBHDF5IO(filepath.replace('.nwb', '_updated.nwb'), mode='w') as export_io:
-                        export_io.export(src_io=read_io, nwbfile=nwbfile)
+        with NWBHDF5IO(output_path, mode='w') as export_io:
+            export_io.export(src_io=read_io, nwbfile=nwbfile)
 
-    else:
-        print(f"Reference {reference} has not associated fix routine.")
+    return output_path
 
 
 def plot_worm(ax, nwb_obj):
@@ -0,0 +1,205 @@
+"""
+gallery.py: Renders visualization reports for NWB files within a directory tree across a pool of worker processes.
+
+Each file gets a PNG summary and an MP4 of its calcium imaging series under the output directory, named after its path
+relative to <path>, or a directory of PNG frames when ffmpeg is not available. The frames and targets each report was
+rendered with are kept in a JSON file next to it, and reports newer than their NWB file and rendered with the same
+frames and targets are left as they are.
+
+Usage:
+    gallery.py -h | --help
+    gallery.py <path> [options]
+
+Options:
+    -h --help                           show this message and exit.
+    --workers=<workers>                 number of worker processes, 0 uses every available core. [default: 0]
+    --subjects=<subjects>               comma-separated 1-based numbers of the files to render, in sorted path order.
+                                        Defaults to every file.
+    --output=<output>                   directory the reports are written to. [default: nwb_validation_results]
+    --frames=<frames>                   start:stop[:step] range of calcium imaging frames to render. [default: 1:75]
+    --targets=<targets>                 neurons to label and plot activity for, either a named set (default, command)
+                                        or comma-separated neuron names. [default: default]
+    --force                             re-render reports that are already up to date.
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+import warnings
+from contextlib import contextmanager
+
+from docopt import docopt
+
+from .corpus import list_nwb_files
+from .helper import print_results, run_pool
+
+RESULTS_DIR = 'nwb_validation_results'
+
+
+def init_worker():
+    # Workers never show a window, and the raw uint16 video frames would log a clipping warning each.
+    import matplotlib.pyplot as plt
+    plt.switch_backend('Agg')
+    warnings.filterwarnings("ignore")
+    logging.getLogger('matplotlib.image').setLevel(logging.ERROR)
+
+
+@contextmanager
+def render_settings():
+    # The settings of init_worker for renders in the caller's own process, restored once they are done, so that a
+    # notebook keeps its backend, warnings and logging.
+    import matplotlib.pyplot as plt
+    backend = plt.get_backend()
+    logger = logging.getLogger('matplotlib.image')
+    level = logger.level
+    with warnings.catch_warnings():
+        try:
+            init_worker()
+            yield
+        finally:
+            logger.setLevel(level)
+            plt.switch_backend(backend)
+
+
+def report_paths(filepath, root, output_dir=RESULTS_DIR):
+    name = os.path.splitext(os.path.relpath(filepath, root))[0].replace(os.sep, '__')
+    return os.path.join(output_dir, f"{name}.png"), os.path.join(output_dir, f"{name}.mp4")
+
+
+def frames_path(video_path):
+    # Where visualize keeps the frames as a PNG sequence when ffmpeg is not available.
+    return os.path.splitext(video_path)[0] + "_frames"
+
+
+def params_path(summary_path):
+    return os.path.splitext(summary_path)[0] + ".json"
+
+
+def render_params(frames=None, targets=None):
+    from .neurons import target_neurons
+    from .visualizer import VIDEO_FRAMES
+
+    frames = frames or VIDEO_FRAMES
+    return {'frames': [frames.start, frames.stop, frames.step], 'targets': target_neurons(targets)}
+
+
+def is_up_to_date(filepath, summary_path, video_path, params):
+    # Up to date when the summary and either the video or its frames are newer than the file and were rendered with
+    # the same frames and targets.
+    source_mtime = os.path.getmtime(filepath)
+    if not all(os.path.exists(path) and os.path.getmtime(path) >= source_mtime
+               for path in [summary_path, params_path(summary_path)]):
+        return False
+
+    if not any(os.path.exists(path) and os.path.getmtime(path) >= source_mtime
+               for path in [video_path, frames_path(video_path)]):
+        return False
+
+    with open(params_path(summary_path), 'r', encoding='utf-8') as params_file:
+        return json.load(params_file) == params
+
+
+def parse_frames(frames):
+    return slice(*[int(part) if part else None for part in frames.split(':')])
+
+
+def partial_path(path):
+    root, ext = os.path.splitext(path)
+    return f"{root}.partial{ext}"
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def replace_path(source, destination):
+    remove_path(destination)
+    os.replace(source, destination)
+
+
+def render_file(filepath, summary_path, video_path, frames=None, targets=None):
+    import matplotlib.pyplot as plt
+    from pynwb import NWBHDF5IO
+    from .visualizer import VIDEO_FRAMES, visualize
+
+    start = time.perf_counter()
+    result = {'file': filepath, 'summary': summary_path, 'video': video_path, 'error': None, 'unsupported': False}
+
+    # Rendered under partial names and renamed once complete, so an interrupted run never looks up to date.
+    partial_summary = partial_path(summary_path)
+    partial_video = partial_path(video_path)
+    try:
+        with NWBHDF5IO(filepath, mode='r') as read_io:
+            nwbfile = read_io.read()
+            written = visualize(nwbfile, frames=frames or VIDEO_FRAMES, video_path=partial_video,
+                                summary_path=partial_summary, targets=targets)
+
+        # visualize returns nothing, and saves no summary, for calcium series it cannot render.
+        if written is None:
+            result['unsupported'] = True
+        else:
+            replace_path(partial_summary, summary_path)
+            if written == partial_video:
+                replace_path(partial_video, video_path)
+            else:
+                result['video'] = frames_path(video_path)
+                replace_path(written, result['video'])
+
+            with open(params_path(summary_path), 'w', encoding='utf-8') as params_file:
+                json.dump(render_params(frames, targets), params_file)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        for path in [partial_summary, partial_video, frames_path(partial_video)]:
+            remove_path(path)
+    finally:
+        plt.close('all')
+
+    result['elapsed'] = time.perf_counter() - start
+    return result
+
+
+def visualize_directory(path, subjects=None, workers=None, output_dir=RESULTS_DIR, frames=None, force=False,
+                        targets=None):
+    nwb_files = list_nwb_files(path)
+    if subjects is not None:
+        nwb_files = [nwb_files[subject - 1] for subject in subjects if 0 < subject <= len(nwb_files)]
+
+    os.makedirs(output_dir, exist_ok=True)
+    params = render_params(frames, targets)
+    pending = []
+    for filepath in nwb_files:
+        summary_path, video_path = report_paths(filepath, path, output_dir)
+        if not force and is_up_to_date(filepath, summary_path, video_path, params):
+            yield {'file': filepath, 'summary': summary_path, 'video': video_path, 'error': None, 'unsupported': False,
+                   'skipped': True, 'elapsed': 0.0}
+            continue
+
+        pending.append((filepath, summary_path, video_path))
+
+    for result in run_pool(render_file, [(*task, frames, targets) for task in pending], workers,
+                           initializer=init_worker, serial_context=render_settings):
+        yield {**result, 'skipped': False}
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__, version='NWB Gallery')
+
+    subjects = [int(subject) for subject in args['--subjects'].split(',')] if args['--subjects'] else None
+
+    def describe(result):
+        if result['unsupported']:
+            return 'unsupported', "unsupported: calcium imaging series not as expected"
+        return 'rendered', f"{result['summary']}, {result['video']} ({result['elapsed']:.1f}s)"
+
+    start = time.perf_counter()
+    counts = print_results(visualize_directory(args['<path>'], subjects=subjects, workers=int(args['--workers']),
+                                               output_dir=args['--output'], frames=parse_frames(args['--frames']),
+                                               force=args['--force'], targets=args['--targets']), describe)
+
+    print(f"\nRendered {counts['rendered']}, skipped {counts['skipped']} up to date, {counts['unsupported']} "
+          f"unsupported, {counts['failed']} failed in {time.perf_counter() - start:.1f}s.")
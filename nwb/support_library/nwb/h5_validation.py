@@ -0,0 +1,168 @@
+import numpy as np
+
+from .helper import scan_nans, voxel_mask_array
+from .rules import COST_SCAN, rule, run_rules, summarize
+
+# The validation rules of both backends, run over the raw HDF5 file and reading only the paths each rule declares. The
+# pynwb backend in validation.py builds the object graph first and then runs these rules over the file it was read from.
+# Expected values come from the validation profile, see profiles/default.yaml.
+
+OPTICAL_CHANNEL_TYPES = ['OpticalChannel', 'OpticalChannelPlus']
+
+
+def neurodata_type(context, path):
+    value = context.attrs(path).get('neurodata_type')
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+
+    return value
+
+
+def iter_interfaces(context):
+    for module_name in context.children('processing'):
+        for interface_name in context.children(f"processing/{module_name}"):
+            yield module_name, interface_name, f"processing/{module_name}/{interface_name}"
+
+
+def interface_kind(context, path):
+    # Every DynamicTable subclass stores its column order in the colnames attribute.
+    if 'colnames' in context.attrs(path):
+        return 'table'
+
+    return {'AnnotationSeries': 'annotation', 'ImageSegmentation': 'segmentation'}.get(neurodata_type(context, path))
+
+
+def tracked_rois(context, path):
+    if interface_kind(context, path) != 'segmentation' or not path.endswith('/TrackedNeurons'):
+        return None
+
+    return voxel_mask_array(context.value(f"{path}/TrackedNeuronROIs/voxel_mask"))
+
+
+@rule('subject.sex', reads=['general/subject/sex'])
+def check_subject_sex(context, params):
+    if context.value('general/subject/sex') not in params['expected']:
+        yield 'subject', 'sex', 'Sex: invalid'
+
+
+@rule('subject.species', reads=['general/subject/species'])
+def check_subject_species(context, params):
+    if context.value('general/subject/species') != params['expected']:
+        yield 'subject', 'species', 'Species: invalid'
+
+
+@rule('subject.strain', reads=['general/subject/strain'])
+def check_subject_strain(context, params):
+    if context.value('general/subject/strain') == params.get('unspecified', "[]"):
+        yield 'subject', 'strain', 'Strain: not specified'
+
+
+@rule('acquisition.keys')
+def check_acquisition_keys(context, params):
+    if context.children('acquisition') != params['expected']:
+        yield 'acquisition', None, 'acquisition keys'
+
+
+@rule('acquisition.grid_spacing', reads=['acquisition/*/imaging_volume/grid_spacing'])
+def check_grid_spacing(context, params):
+    for each_acquisition_module in context.children('acquisition'):
+        grid_spacing = context.value(f"acquisition/{each_acquisition_module}/imaging_volume/grid_spacing")
+        if grid_spacing is None or any(grid_spacing != np.asarray(params['expected'])):
+            yield 'acquisition', each_acquisition_module, f"{each_acquisition_module} grid_spacing"
+
+
+@rule('acquisition.channel_filler', reads=['acquisition/*/imaging_volume/*/emission_range',
+                                           'acquisition/*/imaging_volume/*/emission_lambda',
+                                           'acquisition/*/imaging_volume/*/excitation_range',
+                                           'acquisition/*/imaging_volume/*/excitation_lambda'])
+def check_channel_filler(context, params):
+    for each_acquisition_module in context.children('acquisition'):
+        volume_path = f"acquisition/{each_acquisition_module}/imaging_volume"
+        for channel_name in context.children(volume_path):
+            channel_path = f"{volume_path}/{channel_name}"
+            if neurodata_type(context, channel_path) not in OPTICAL_CHANNEL_TYPES:
+                continue
+
+            channel = {field: context.value(f"{channel_path}/{field}") for field in
+                       ['emission_range', 'emission_lambda', 'excitation_range', 'excitation_lambda']}
+            if (
+                    channel_name not in params['expected']
+                    or any(value is None for value in channel.values())
+                    or any(channel['emission_range'] == [0, 0])
+                    or channel['emission_lambda'] == 0
+                    or any(channel['excitation_range'] == [0, 0])
+                    or channel['excitation_lambda'] == 0
+            ):
+                yield 'acquisition', each_acquisition_module, \
+                    f"{each_acquisition_module}: channel {channel_name} contains filler info"
+
+
+@rule('processing.unexpected_module')
+def check_processing_modules(context, params):
+    for module_name in context.children('processing'):
+        if module_name not in params['expected']:
+            yield module_name, None, f"Unexpected processing key: {module_name}"
+
+
+@rule('processing.activity_nan', cost=COST_SCAN)
+def check_activity_nans(context, params):
+    for module_name, interface_name, path in iter_interfaces(context):
+        if interface_kind(context, path) != 'table' or "Activity" not in list(context.attrs(path)['colnames']):
+            continue
+
+        # Streamed rather than prefetched, the column can be as long as the recording. A ragged column keeps its values
+        # in Activity and their row offsets in Activity_index.
+        nan_count, first_row = scan_nans(context.dataset(f"{path}/Activity"), early_exit=context.fail_fast,
+                                         index=context.dataset(f"{path}/Activity_index"))
+        if nan_count > 0:
+            # Failing fast stops at the first block holding a NaN, so the count would only be a lower bound.
+            count = '' if context.fail_fast else f"{nan_count} "
+            yield module_name, interface_name, f"{module_name} {interface_name} contains {count}NaN values in " \
+                                               f"Activity column (first at row {first_row})"
+
+
+@rule('processing.timestamp_mismatch')
+def check_timestamps(context, params):
+    for module_name, interface_name, path in iter_interfaces(context):
+        if interface_kind(context, path) != 'annotation':
+            continue
+
+        if context.dataset(f"{path}/data").shape != context.dataset(f"{path}/timestamps").shape:
+            yield module_name, interface_name, f"{module_name} {interface_name} data/timestamp dim mismatch"
+
+
+@rule('processing.roi_time_compressed', reads=['processing/*/TrackedNeurons/TrackedNeuronROIs/voxel_mask'],
+      cost=COST_SCAN)
+def check_roi_dimensions(context, params):
+    for module_name, interface_name, path in iter_interfaces(context):
+        rois = tracked_rois(context, path)
+        if rois is not None and rois.shape[1] < params.get('min_dimensions', 3):
+            yield module_name, interface_name, f"{module_name} {interface_name} ROI compressed along time dimension"
+
+
+@rule('processing.roi_all_zero', reads=['processing/*/TrackedNeurons/TrackedNeuronROIs/voxel_mask'],
+      after=['processing.roi_time_compressed'], cost=COST_SCAN)
+def check_roi_values(context, params):
+    for module_name, interface_name, path in iter_interfaces(context):
+        rois = tracked_rois(context, path)
+        if rois is not None and not (rois > 0).any(axis=(0, 1)):
+            yield module_name, interface_name, \
+                f"{module_name} {interface_name} ROI has all-zero slices along dimensions"
+
+
+@rule('processing.unexpected_child')
+def check_interface_types(context, params):
+    for module_name, interface_name, path in iter_interfaces(context):
+        if interface_kind(context, path) is None:
+            yield module_name, interface_name, \
+                f"{module_name} unexpected child class: {neurodata_type(context, path)}"
+
+
+def iter_issues(h5_file, file=None, profile=None, fail_fast=False, timings=None, read_counter=None):
+    yield from run_rules(h5_file, profile=profile, file=file, fail_fast=fail_fast, timings=timings,
+                         read_counter=read_counter)
+
+
+def validate(h5_file, profile=None, fail_fast=False, timings=None, read_counter=None):
+    return summarize(list(iter_issues(h5_file, profile=profile, fail_fast=fail_fast, timings=timings,
+                                      read_counter=read_counter)), fail_fast)
@@ -1,4 +1,22 @@
 import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from datetime import datetime
+
+import h5py
+import numpy as np
+from numpy.lib.recfunctions import structured_to_unstructured
+
+# Target size of each read when scanning datasets block by block.
+SCAN_BLOCK_BYTES = 8 * 1024 * 1024
+# Peak memory a streamed max projection may use for its running maxima plus the slab being read.
+MIP_MEMORY_BYTES = 256 * 1024 * 1024
+# Frames merged into each bin of a decimation pyramid level, from the level below it.
+PYRAMID_FACTOR = 4
+# Most bins the coarsest pyramid level may have; recordings at most this long get no pyramid at all.
+PYRAMID_MAX_BINS = 256
+
 
 def maedeh_decode_subject(subject_id):
     if "\\" in subject_id:
@@ -10,4 +28,269 @@ def maedeh_decode_subject(subject_id):
     reference_date = subject_list[0]
     reference_run = subject_list[1][1]
 
-    return reference_date, reference_run
\ No newline at end of file
+    return reference_date, reference_run
+
+
+def decode_strings(values):
+    values = np.asarray(values)
+    return np.char.decode(values, 'utf-8') if values.dtype.kind == 'S' else values.astype(str)
+
+
+def scalar_value(value, dtype):
+    # Casts value, e.g. a cultivation temperature of '20' read from a manifest, to a scalar of dtype.
+    if h5py.check_string_dtype(dtype) is not None:
+        return value.isoformat() if isinstance(value, datetime) else str(value)
+
+    if dtype.kind == 'f':
+        return np.asarray(float(value), dtype=dtype)
+
+    if dtype.kind in 'iu':
+        return np.asarray(int(value), dtype=dtype)
+
+    return np.asarray(value, dtype=dtype)
+
+
+def write_scalar(group, name, value, dtype=None):
+    # Overwrites a scalar dataset in place, creating it with dtype when missing.
+    if name not in group:
+        if dtype is None:
+            raise TypeError(f"{group.name}/{name} is missing and its dtype is unknown.")
+
+        group.create_dataset(name, data=scalar_value(value, dtype), dtype=dtype)
+        return
+
+    dataset = group[name]
+    string_info = h5py.check_string_dtype(dataset.dtype)
+    if string_info is None:
+        dataset[...] = scalar_value(value, dataset.dtype)
+        return
+
+    encoded = scalar_value(value, dataset.dtype).encode(string_info.encoding)
+    if string_info.length is None or len(encoded) <= string_info.length:
+        dataset[...] = encoded
+        return
+
+    # A fixed-length string would truncate the new value, so the dataset is replaced by a variable-length one.
+    shape, attrs = dataset.shape, dict(dataset.attrs)
+    del group[name]
+    dataset = group.create_dataset(name, shape=shape, dtype=h5py.string_dtype(string_info.encoding))
+    dataset[...] = encoded
+    dataset.attrs.update(attrs)
+
+
+def record_modification(h5_file, modified=None):
+    # NWB keeps the creation date followed by the date of every later modification in file_create_date.
+    modified = (modified or datetime.now().astimezone()).isoformat()
+    dates = h5_file['file_create_date']
+    if dates.maxshape[0] is None:
+        dates.resize((dates.shape[0] + 1,))
+        dates[-1] = modified
+        return
+
+    values, dtype, attrs = list(dates[:]), dates.dtype, dict(dates.attrs)
+    del h5_file['file_create_date']
+    dates = h5_file.create_dataset('file_create_date', data=values + [modified.encode('utf-8')], dtype=dtype,
+                                   maxshape=(None,), chunks=True)
+    dates.attrs.update(attrs)
+
+
+def scan_block_rows(data, target_bytes=SCAN_BLOCK_BYTES, axis=0):
+    row_shape = data.shape[:axis] + data.shape[axis + 1:]
+    row_bytes = max(int(np.prod(row_shape)) * data.dtype.itemsize, 1)
+    rows = max(target_bytes // row_bytes, 1)
+
+    # Round down to whole chunks so that no chunk is decompressed twice.
+    chunks = getattr(data, 'chunks', None)
+    if chunks:
+        rows = max(rows // chunks[axis], 1) * chunks[axis]
+
+    return rows
+
+
+def scan_nans(data, early_exit=True, index=None):
+    # NaN count and first row holding a NaN, scanning data block by block and, with early_exit, stopping at the first
+    # block holding any so that the count only covers the rows scanned. Given the index of a ragged column, data is
+    # its flat values and rows are the index's table rows.
+    if not hasattr(data, 'dtype') or data.dtype == object:
+        data = np.asarray(data, dtype=float)
+
+    if not np.issubdtype(data.dtype, np.inexact) or data.shape == ():
+        return 0, None
+
+    nan_count = 0
+    first_row = None
+    block_rows = scan_block_rows(data)
+    for start in range(0, data.shape[0], block_rows):
+        nan_mask = np.isnan(data[start:start + block_rows])
+        if not nan_mask.any():
+            continue
+
+        row_mask = nan_mask.reshape(nan_mask.shape[0], -1).any(axis=1)
+        nan_count += int(nan_mask.sum())
+        if first_row is None:
+            first_row = start + int(np.argmax(row_mask))
+
+        if early_exit:
+            break
+
+    if first_row is not None and index is not None:
+        # Row r of a ragged column holds the values index[r - 1]:index[r].
+        first_row = int(np.searchsorted(index[:], first_row, side='right'))
+
+    return nan_count, first_row
+
+
+def max_projection(data, channels, memory_budget=MIP_MEMORY_BYTES):
+    # Projects a (C, Z, X, Y) volume along Z for the given channels, returning (len(channels), X, Y).
+    channel_list = sorted(set(int(channel) for channel in channels))
+    plane_bytes = max(int(np.prod(data.shape[2:])) * data.dtype.itemsize * len(channel_list), 1)
+    slab_planes = max(memory_budget // plane_bytes - 1, 1)
+
+    # Round down to whole chunks along Z so that no chunk is decompressed twice.
+    chunks = getattr(data, 'chunks', None)
+    if chunks:
+        slab_planes = max(slab_planes // chunks[1], 1) * chunks[1]
+
+    projection = None
+    for start in range(0, data.shape[1], slab_planes):
+        slab_max = data[channel_list, start:start + slab_planes].max(axis=1)
+        if projection is None:
+            projection = slab_max
+        else:
+            np.maximum(projection, slab_max, out=projection)
+
+    return projection[[channel_list.index(int(channel)) for channel in channels]]
+
+
+def iter_frame_projections(data, frames=slice(None), channels=None):
+    # Yields (frame index, (X, Y, C) projection along Z) for each selected frame of a (T, X, Y, Z, C) series. At most
+    # one chunk's worth of frames is read at a time, so memory stays flat however many frames are projected.
+    frame_indices = range(*frames.indices(data.shape[0]))
+    channel_list = slice(None) if channels is None else sorted(set(int(channel) for channel in channels))
+    channel_order = slice(None) if channels is None else [channel_list.index(int(channel)) for channel in channels]
+
+    chunks = getattr(data, 'chunks', None)
+    frames_per_read = max(chunks[0] // abs(frame_indices.step), 1) if chunks else 1
+
+    for position in range(0, len(frame_indices), frames_per_read):
+        block_indices = frame_indices[position:position + frames_per_read]
+        # Descending ranges are read in ascending order, which datasets require, and reversed in memory.
+        first, last = sorted([block_indices[0], block_indices[-1]])
+        block = data[first:last + 1:abs(block_indices.step), ..., channel_list]
+        if block_indices.step < 0:
+            block = block[::-1]
+        for frame_idx, frame in zip(block_indices, block):
+            yield frame_idx, frame.max(axis=2)[..., channel_order]
+
+
+def decimation_pyramid(data, factor=PYRAMID_FACTOR, max_bins=PYRAMID_MAX_BINS):
+    # Min/max pyramid of a (rows, frames) dataset: level k holds (mins, maxs), each (rows, bins), over bins of
+    # factor ** (k + 1) frames, ignoring NaNs. Frames are read a block of whole coarsest bins at a time.
+    n_rows, n_frames = data.shape
+    n_levels = 0
+    while -(-n_frames // factor ** n_levels) > max_bins:
+        n_levels += 1
+    if n_levels == 0:
+        return []
+
+    dtype = np.result_type(data.dtype, np.float32)
+    top_bin = factor ** n_levels
+    block_frames = max(SCAN_BLOCK_BYTES // max(n_rows * dtype.itemsize, 1) // top_bin, 1) * top_bin
+
+    blocks = [([], []) for _ in range(n_levels)]
+    for start in range(0, n_frames, block_frames):
+        block = np.asarray(data[:, start:start + block_frames], dtype=dtype)
+        # NaN padding completes the last bins without affecting their minima and maxima.
+        mins = maxs = np.pad(block, ((0, 0), (0, -block.shape[1] % top_bin)), constant_values=np.nan)
+        for level_mins, level_maxs in blocks:
+            mins = np.fmin.reduce(mins.reshape(n_rows, -1, factor), axis=2)
+            maxs = np.fmax.reduce(maxs.reshape(n_rows, -1, factor), axis=2)
+            level_mins.append(mins)
+            level_maxs.append(maxs)
+
+    pyramid = []
+    for level, (level_mins, level_maxs) in enumerate(blocks, start=1):
+        n_bins = -(-n_frames // factor ** level)
+        pyramid.append((np.concatenate(level_mins, axis=1)[:, :n_bins],
+                        np.concatenate(level_maxs, axis=1)[:, :n_bins]))
+
+    return pyramid
+
+
+def decimated_trace(data, pyramid, row, max_bins, factor=PYRAMID_FACTOR):
+    # (frames, values) of one row: the raw row when it has at most max_bins frames, otherwise the minimum and maximum of
+    # each bin of the finest pyramid level with at most max_bins bins, so that no peak is lost.
+    n_frames = data.shape[1]
+    if n_frames <= max_bins or not pyramid:
+        return np.arange(n_frames), np.asarray(data[row], dtype=float)
+
+    level = next((level for level, (mins, _) in enumerate(pyramid) if mins.shape[1] <= max_bins), len(pyramid) - 1)
+    mins, maxs = pyramid[level]
+    bin_frames = factor ** (level + 1)
+    centers = np.minimum(np.arange(mins.shape[1]) * bin_frames + (bin_frames - 1) / 2, n_frames - 1)
+    return np.repeat(centers, 2), np.column_stack([mins[row], maxs[row]]).ravel()
+
+
+def read_voxel_mask(voxel_mask, fields=None):
+    data = voxel_mask if isinstance(voxel_mask, (np.ndarray, h5py.Dataset)) else getattr(voxel_mask, 'data', voxel_mask)
+
+    # h5py can read a subset of compound fields straight from disk without touching the others.
+    if fields is not None and isinstance(data, h5py.Dataset):
+        return data.fields(list(fields))[:]
+
+    values = data[:]
+    if fields is not None and getattr(values, 'dtype', None) is not None and values.dtype.names:
+        values = values[list(fields)]
+
+    return values
+
+
+def voxel_mask_array(voxel_mask, fields=None):
+    values = read_voxel_mask(voxel_mask, fields)
+
+    if isinstance(values, np.ndarray) and values.dtype.names:
+        return structured_to_unstructured(values)
+
+    values = np.asarray(values.tolist() if isinstance(values, np.ndarray) else values)
+    return values.reshape(len(values), -1)
+
+
+def run_pool(func, tasks, workers=None, initializer=None, serial_context=nullcontext):
+    # Yields func(*task) of each task as it completes across up to workers processes, each set up by initializer.
+    # A single worker or task runs in order in this process instead, each call inside serial_context, which lets
+    # callers apply the settings of initializer and restore them afterwards.
+    tasks = list(tasks)
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(tasks) <= 1:
+        for task in tasks:
+            with serial_context():
+                result = func(*task)
+            yield result
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=initializer) as executor:
+        futures = [executor.submit(func, *task) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def print_status(n, filepath, status):
+    print(f"{n} | {os.path.basename(filepath)} | {status}")
+
+
+def print_results(results, describe):
+    # Prints one status line per result and counts them by outcome: 'failed' for results with an error, 'skipped'
+    # for skipped ones and otherwise the (outcome, status) that describe gives.
+    counts = Counter()
+    for n, result in enumerate(results, start=1):
+        if result['error'] is not None:
+            outcome, status = 'failed', f"ERROR: {result['error']}"
+        elif result.get('skipped'):
+            outcome, status = 'skipped', 'up to date'
+        else:
+            outcome, status = describe(result)
+
+        counts[outcome] += 1
+        print_status(n, result['file'], status)
+
+    return counts
@@ -0,0 +1,237 @@
+"""
+multiscale.py: Exports multiscale pyramids of the NeuroPAL and calcium imaging volumes of NWB files within a directory
+tree across a pool of worker processes.
+
+Each level halves the one below it along x and y by 2x2 max pooling, which commutes with the max projections drawn by
+visualizer.py, and is written next to the NWB file to a Zarr group named <file>.multiscale.zarr with OME-NGFF style
+multiscales metadata. Arrays keep the axis order of their NWB dataset. Pyramids of unchanged NWB files are skipped.
+
+Usage:
+    multiscale.py -h | --help
+    multiscale.py <path> [options]
+
+Options:
+    -h --help                           show this message and exit.
+    --workers=<workers>                 number of worker processes, 0 uses every available core. [default: 0]
+    --threads=<threads>                 threads pooling the blocks of each volume. [default: 4]
+    --min-size=<min-size>               smallest x or y extent the coarsest level may have. [default: 32]
+    --force                             re-export pyramids that are already up to date.
+"""
+
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import h5py
+import numpy as np
+from docopt import docopt
+
+try:
+    import zarr
+except ImportError:
+    zarr = None
+
+from .corpus import list_nwb_files
+from .helper import print_results, run_pool, scan_block_rows
+
+MULTISCALE_SUFFIX = '.multiscale.zarr'
+# Axis names of each exported acquisition, the axis its volume is streamed along and the x and y axes levels halve.
+MULTISCALE_DATASETS = {
+    'NeuroPALImageRaw': {'axes': ['c', 'z', 'x', 'y'], 'block_axis': 1, 'xy_axes': [2, 3]},
+    'CalciumImageSeries': {'axes': ['t', 'x', 'y', 'z', 'c'], 'block_axis': 0, 'xy_axes': [1, 2]},
+}
+AXIS_TYPES = {'t': 'time', 'c': 'channel', 'z': 'space', 'x': 'space', 'y': 'space'}
+MIN_LEVEL_SIZE = 32
+# multiscale_level reads full resolution datasets under this size, or with under margin times the requested pixels.
+MULTISCALE_MIN_BYTES = 32 * 1024 * 1024
+MULTISCALE_MARGIN = 4
+EXPORT_THREADS = 4
+
+
+class OrthogonalArray:
+    # Indexes a Zarr array the way visualizer.py indexes h5py datasets, mixing lists and slices along different axes.
+    def __init__(self, array):
+        self.array = array
+
+    def __getitem__(self, key):
+        return self.array.oindex[key]
+
+    def __getattr__(self, name):
+        return getattr(self.array, name)
+
+
+def multiscale_path(filepath):
+    return filepath + MULTISCALE_SUFFIX
+
+
+def source_stamp(filepath):
+    stat = os.stat(filepath)
+    return {'source_mtime': stat.st_mtime, 'source_size': stat.st_size}
+
+
+def open_multiscale(filepath):
+    # The pyramid next to filepath, or None when there is none or it was exported from an older version of the file.
+    if zarr is None or not os.path.isdir(multiscale_path(filepath)):
+        return None
+
+    try:
+        group = zarr.open_group(multiscale_path(filepath), mode='r')
+        stamp = source_stamp(filepath)
+    except (OSError, ValueError):
+        return None
+
+    if any(group.attrs.get(key) != value for key, value in stamp.items()):
+        return None
+
+    return group
+
+
+def multiscale_level(data, output_size, margin=MULTISCALE_MARGIN, min_bytes=MULTISCALE_MIN_BYTES):
+    # Coarsest level of an NWB acquisition dataset with at least output_size = (x, y) pixels, or data itself when its
+    # file has no up to date pyramid, no level is that large, or data is too small for a level to be worth opening.
+    if output_size is None or not isinstance(data, h5py.Dataset):
+        return data
+
+    name = os.path.basename(os.path.dirname(data.name))
+    if name not in MULTISCALE_DATASETS or data.size * data.dtype.itemsize < min_bytes:
+        return data
+
+    # Reading a level costs more per voxel than the full resolution dataset, so it only pays once data has margin
+    # times the pixels output_size needs along x and y.
+    xy_shape = [data.shape[axis] for axis in MULTISCALE_DATASETS[name]['xy_axes']]
+    if any(length < margin * size for length, size in zip(xy_shape, output_size)):
+        return data
+
+    group = open_multiscale(data.file.filename)
+    if group is None or name not in group:
+        return data
+
+    # Level shapes follow from level_shapes, so only the chosen level is opened.
+    level = 0
+    for shape in level_shapes(data.shape, MULTISCALE_DATASETS[name]['xy_axes']):
+        if level == len(group[name].attrs['multiscales'][0]['datasets']) or any(
+                shape[axis] < size for axis, size in zip(MULTISCALE_DATASETS[name]['xy_axes'], output_size)):
+            break
+        level += 1
+
+    return data if level == 0 else OrthogonalArray(group[name][str(level)])
+
+
+def level_shapes(shape, xy_axes, min_size=MIN_LEVEL_SIZE):
+    # Shapes of levels 1, 2, ..., each halving x and y of the one below it, rounded up.
+    shapes = []
+    level_shape = list(shape)
+    while max(-(-level_shape[axis] // 2) for axis in xy_axes) >= min_size:
+        for axis in xy_axes:
+            level_shape[axis] = -(-level_shape[axis] // 2)
+        shapes.append(tuple(level_shape))
+
+    return shapes
+
+
+def max_pool(block, xy_axes):
+    # Odd extents repeat their last row or column, which leaves the maximum of the edge pixels unchanged.
+    block = np.pad(block, [(0, block.shape[axis] % 2 if axis in xy_axes else 0) for axis in range(block.ndim)],
+                   mode='edge')
+    pooled_shape = []
+    for axis, length in enumerate(block.shape):
+        pooled_shape += [length // 2, 2] if axis in xy_axes else [length]
+
+    return block.reshape(pooled_shape).max(axis=tuple(axis + i + 1 for i, axis in enumerate(sorted(xy_axes))))
+
+
+def export_block(data, arrays, block_axis, xy_axes, start, stop):
+    index = [slice(None)] * data.ndim
+    index[block_axis] = slice(start, stop)
+    block = data[tuple(index)]
+    for array in arrays:
+        block = max_pool(block, xy_axes)
+        array[tuple(index)] = block
+
+
+def export_dataset(data, group, name, min_size=MIN_LEVEL_SIZE, threads=EXPORT_THREADS):
+    axes, block_axis, xy_axes = (MULTISCALE_DATASETS[name][key] for key in ['axes', 'block_axis', 'xy_axes'])
+    # Blocks hold whole source chunks and each block fills whole Zarr chunks, so blocks can be pooled concurrently.
+    block_length = scan_block_rows(data, axis=block_axis)
+
+    dataset_group = group.create_group(name)
+    arrays = []
+    datasets = []
+    for level, shape in enumerate(level_shapes(data.shape, xy_axes, min_size), start=1):
+        chunks = list(shape)
+        chunks[block_axis] = min(block_length, shape[block_axis])
+        arrays.append(dataset_group.create_array(str(level), shape=shape, chunks=tuple(chunks), dtype=data.dtype))
+        datasets.append({'path': str(level), 'coordinateTransformations': [
+            {'type': 'scale', 'scale': [2.0 ** level if axis in xy_axes else 1.0 for axis in range(len(axes))]}]})
+
+    dataset_group.attrs['multiscales'] = [{'version': '0.4', 'name': name, 'type': 'max', 'datasets': datasets,
+                                           'axes': [{'name': axis, 'type': AXIS_TYPES[axis]} for axis in axes]}]
+
+    if arrays:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(lambda start: export_block(data, arrays, block_axis, xy_axes, start, start + block_length),
+                              range(0, data.shape[block_axis], block_length)))
+
+    return len(arrays)
+
+
+def export_file(filepath, min_size=MIN_LEVEL_SIZE, threads=EXPORT_THREADS):
+    start = time.perf_counter()
+    result = {'file': filepath, 'levels': {}, 'error': None}
+
+    # Written under a partial name and renamed once complete, so an interrupted export is never read.
+    output_path = multiscale_path(filepath)
+    partial_path = f"{output_path}.partial"
+    try:
+        if zarr is None:
+            raise ImportError("zarr is required to export multiscale pyramids.")
+
+        shutil.rmtree(partial_path, ignore_errors=True)
+        group = zarr.open_group(partial_path, mode='w')
+        with h5py.File(filepath, 'r') as h5_file:
+            for name in MULTISCALE_DATASETS:
+                if f"acquisition/{name}/data" in h5_file:
+                    result['levels'][name] = export_dataset(h5_file[f"acquisition/{name}/data"], group, name,
+                                                            min_size, threads)
+
+        group.attrs.update(source_stamp(filepath))
+        shutil.rmtree(output_path, ignore_errors=True)
+        os.replace(partial_path, output_path)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        shutil.rmtree(partial_path, ignore_errors=True)
+
+    result['elapsed'] = time.perf_counter() - start
+    return result
+
+
+def export_directory(path, workers=None, min_size=MIN_LEVEL_SIZE, threads=EXPORT_THREADS, force=False):
+    nwb_files = [path] if os.path.isfile(path) else list_nwb_files(path)
+
+    pending = []
+    for filepath in nwb_files:
+        if not force and open_multiscale(filepath) is not None:
+            yield {'file': filepath, 'levels': {}, 'error': None, 'skipped': True, 'elapsed': 0.0}
+            continue
+
+        pending.append(filepath)
+
+    for result in run_pool(export_file, [(filepath, min_size, threads) for filepath in pending], workers):
+        yield {**result, 'skipped': False}
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__, version='NWB Multiscale Export')
+
+    def describe(result):
+        levels = ', '.join(f"{name} {count} levels" for name, count in result['levels'].items())
+        return 'exported', f"{levels} ({result['elapsed']:.1f}s)"
+
+    start = time.perf_counter()
+    counts = print_results(export_directory(args['<path>'], workers=int(args['--workers']),
+                                            min_size=int(args['--min-size']), threads=int(args['--threads']),
+                                            force=args['--force']), describe)
+
+    print(f"\nExported {counts['exported']}, skipped {counts['skipped']} up to date, {counts['failed']} failed in "
+          f"{time.perf_counter() - start:.1f}s.")
@@ -0,0 +1,194 @@
+import weakref
+
+import numpy as np
+from hdmf.common import DynamicTableRegion
+
+from .helper import decode_strings, scan_block_rows
+
+DEFAULT_TARGETS = 'default'
+# Named sets of neurons the plotting functions can be pointed at instead of an explicit list.
+TARGET_SETS = {
+    'default': ['AWAL', 'I2L', 'AVAL', 'AVBL', 'AWAR', 'I2R', 'AVAR', 'AVBR', 'VB2'],
+    'command': ['AVAL', 'AVAR', 'AVBL', 'AVBR', 'AVDL', 'AVDR', 'AVEL', 'AVER', 'PVCL', 'PVCR'],
+}
+
+# Path below nwb_obj.processing and name column of each table the index covers.
+NEURON_TABLES = {
+    'activity': (['CalciumActivity', 'ActivityTraces'], 'neuron'),
+    'neuropal': (['NeuroPAL', 'NeuroPALSegmentation', 'NeuroPALNeurons'], 'ID_labels'),
+    'tracked': (['NeuroPAL', 'TrackedNeurons'], 'neuron_id'),
+}
+# Name column of the table a DynamicTableRegion name column, such as the neuron_id fix_track writes, refers to.
+REGION_NAME_COLUMN = 'neuron'
+
+# Per open NWB file, {table: {name: rows}} for each table looked up so far.
+NEURON_INDEX_MEMO = weakref.WeakKeyDictionary()
+# Per open NWB file, the (start, stop) TrackedNeurons rows of each frame.
+FRAME_INDEX_MEMO = weakref.WeakKeyDictionary()
+# Per open NWB file, {(table, column): names} of each region name column decoded so far.
+NAME_TABLE_MEMO = weakref.WeakKeyDictionary()
+# Open NWB files whose TrackedNeurons trajectory has scanned once, later queries build and use the name index.
+TRAJECTORY_SCAN_MEMO = weakref.WeakSet()
+TRACK_AXES = ['x', 'y', 'z']
+# Tables of at most this many rows are scanned whole rather than indexed by trajectory.
+SCAN_TABLE_ROWS = 65536
+
+
+def target_neurons(targets=None):
+    # targets is a list of names, the name of one of TARGET_SETS or comma-separated neuron names.
+    if targets is None:
+        targets = DEFAULT_TARGETS
+
+    if isinstance(targets, str):
+        return list(TARGET_SETS[targets]) if targets in TARGET_SETS else [name for name in targets.split(',') if name]
+
+    return list(targets)
+
+
+def read_table(nwb_obj, path, column):
+    try:
+        table = nwb_obj.processing[path[0]]
+        for name in path[1:]:
+            table = table[name]
+    except KeyError:
+        return None
+
+    # TrackedNeurons is only a named table once fix_track has rewritten it.
+    return table if column in getattr(table, 'colnames', ()) else None
+
+
+def name_rows(names):
+    # Rows of each distinct name in ascending order, from one sort rather than a scan per name.
+    order = np.argsort(names, kind='stable')
+    unique_names, starts = np.unique(names[order], return_index=True)
+    return dict(zip(unique_names.tolist(), np.split(order, starts[1:])))
+
+
+def lookup_names(nwb_obj, table, column):
+    # Names the rows column refers to when it is a region into a table of names, or None when it holds the names.
+    # Decoded on first use and kept for as long as nwb_obj lives.
+    region = table[column]
+    if not isinstance(region, DynamicTableRegion):
+        return None
+
+    file_names = NAME_TABLE_MEMO.setdefault(nwb_obj, {})
+    if (table.name, column) not in file_names:
+        file_names[(table.name, column)] = decode_strings(region.table[REGION_NAME_COLUMN].data[:])
+
+    return file_names[(table.name, column)]
+
+
+def column_rows(nwb_obj, path, column):
+    table = read_table(nwb_obj, path, column)
+    if table is None:
+        return {}
+
+    # fix_track stores neuron_id as rows of a table of names, which sort far faster than the names do.
+    names = lookup_names(nwb_obj, table, column)
+    if names is not None:
+        return {names[code]: rows for code, rows in name_rows(table[column].data[:]).items()}
+
+    return name_rows(decode_strings(table[column].data[:]))
+
+
+def neuron_rows(nwb_obj, table):
+    # {name: rows} of one of NEURON_TABLES, built on first use and kept for as long as nwb_obj lives. Files without
+    # the table give an empty index.
+    file_index = NEURON_INDEX_MEMO.setdefault(nwb_obj, {})
+    if table not in file_index:
+        file_index[table] = column_rows(nwb_obj, *NEURON_TABLES[table])
+
+    return file_index[table]
+
+
+def frame_rows(nwb_obj, t):
+    # Rows of frame t in TrackedNeurons, as a slice given by the TrackedNeuronFrames offsets fix_track writes next to
+    # the time-sorted table. Tables without them are indexed from their t column on first use instead.
+    if nwb_obj not in FRAME_INDEX_MEMO:
+        frames = read_table(nwb_obj, ['NeuroPAL', 'TrackedNeuronFrames'], 'start')
+        if frames is not None:
+            FRAME_INDEX_MEMO[nwb_obj] = frames['start'].data[:], frames['stop'].data[:]
+        else:
+            table = read_table(nwb_obj, *NEURON_TABLES['tracked'])
+            FRAME_INDEX_MEMO[nwb_obj] = name_rows(table['t'].data[:] if table is not None else np.array([], dtype=int))
+
+    index = FRAME_INDEX_MEMO[nwb_obj]
+    if isinstance(index, dict):
+        return index.get(t, np.array([], dtype=int))
+
+    starts, stops = index
+    return slice(int(starts[t]), int(stops[t])) if 0 <= t < len(starts) else slice(0, 0)
+
+
+def read_rows(data, rows):
+    # Contiguous rows are read as one slice. Scattered, ascending rows are picked out of whole-chunk blocks, skipping
+    # blocks that hold none of them, as h5py point selections are far slower than decompressing the chunks.
+    if isinstance(rows, slice):
+        return data[rows]
+
+    block_rows = scan_block_rows(data)
+    blocks, splits = np.unique(rows // block_rows, return_index=True)
+    parts = [data[:0]]
+    for block, block_indices in zip(blocks, np.split(rows, splits[1:])):
+        start = int(block) * block_rows
+        parts.append(data[start:start + block_rows][block_indices - start])
+
+    return np.concatenate(parts)
+
+
+def decode_names(nwb_obj, table, values, column='neuron_id'):
+    # Names of values read from a name column of table, looked up by row when the column is a region of names.
+    names = lookup_names(nwb_obj, table, column)
+    return names[values] if names is not None else decode_strings(values)
+
+
+def tracked_neurons_dataframe(nwb_obj):
+    # TrackedNeurons as a flat DataFrame with neuron_id holding names, or None when the file has no tracks. pynwb's own
+    # to_dataframe gives each row a DataFrame of its TrackedNeuronNames row, which takes seconds for long tracks.
+    table = read_table(nwb_obj, *NEURON_TABLES['tracked'])
+    if table is None:
+        return None
+
+    dataframe = table.to_dataframe(index=True)
+    dataframe['neuron_id'] = decode_names(nwb_obj, table, dataframe['neuron_id'].to_numpy())
+    return dataframe
+
+
+def tracks_at(nwb_obj, t):
+    # Names and (n, 3) x, y, z positions of the neurons tracked at frame t, reading only that frame's rows.
+    table = read_table(nwb_obj, *NEURON_TABLES['tracked'])
+    if table is None:
+        return np.array([], dtype=str), np.empty((0, len(TRACK_AXES)), dtype=np.float32)
+
+    rows = frame_rows(nwb_obj, t)
+    names = decode_names(nwb_obj, table, read_rows(table['neuron_id'].data, rows))
+
+    return names, np.stack([read_rows(table[axis].data, rows) for axis in TRACK_AXES], axis=-1)
+
+
+def scanned_rows(nwb_obj, table, column, name):
+    # Rows of name found by reading column whole, with no index built.
+    names = lookup_names(nwb_obj, table, column)
+    if names is not None:
+        return np.flatnonzero(np.isin(table[column].data[:], np.flatnonzero(names == name)))
+
+    return np.flatnonzero(decode_strings(table[column].data[:]) == name)
+
+
+def trajectory(nwb_obj, neuron):
+    # Frames and (n, 3) x, y, z positions of one named neuron in frame order, reading only its rows. The first query
+    # on a short table scans it whole, which costs less than sorting it into the name index, and any further query
+    # builds the index and reuses it.
+    table = read_table(nwb_obj, *NEURON_TABLES['tracked'])
+    if (table is not None and len(table) <= SCAN_TABLE_ROWS and nwb_obj not in TRAJECTORY_SCAN_MEMO
+            and 'tracked' not in NEURON_INDEX_MEMO.get(nwb_obj, {})):
+        TRAJECTORY_SCAN_MEMO.add(nwb_obj)
+        rows = scanned_rows(nwb_obj, table, NEURON_TABLES['tracked'][1], neuron)
+    else:
+        rows = neuron_rows(nwb_obj, 'tracked').get(neuron, np.array([], dtype=int))
+    if table is None or not len(rows):
+        return np.array([], dtype=int), np.empty((0, len(TRACK_AXES)), dtype=np.float32)
+
+    frames = read_rows(table['t'].data, rows)
+    order = np.argsort(frames, kind='stable')
+    return frames[order], np.stack([read_rows(table[axis].data, rows) for axis in TRACK_AXES], axis=-1)[order]
@@ -0,0 +1,31 @@
+import functools
+import os
+
+import yaml
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+DEFAULT_PROFILE = 'default'
+
+
+def load_profile(profile=None):
+    if isinstance(profile, dict):
+        return profile
+
+    return read_profile(profile or DEFAULT_PROFILE)
+
+
+@functools.lru_cache(maxsize=None)
+def read_profile(profile):
+    # A profile is either a path to a YAML file or the name of one shipped within the profiles directory.
+    profile_path = profile if os.path.isfile(profile) else os.path.join(PROFILE_DIR, f"{profile}.yaml")
+    if not os.path.isfile(profile_path):
+        raise FileNotFoundError(f"Could not find validation profile {profile}.")
+
+    with open(profile_path, 'r', encoding='utf-8') as profile_file:
+        loaded_profile = yaml.safe_load(profile_file)
+
+    if not isinstance(loaded_profile, dict) or not isinstance(loaded_profile.get('rules'), dict):
+        raise ValueError(f"Validation profile {profile_path} does not define a rules mapping.")
+
+    loaded_profile['rules'] = {rule_id: params or {} for rule_id, params in loaded_profile['rules'].items()}
+    return loaded_profile
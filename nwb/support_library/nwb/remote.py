@@ -0,0 +1,162 @@
+import io
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import h5py
+
+try:
+    import fsspec
+    from fsspec.caching import BaseCache, register_cache
+except ImportError:
+    fsspec = None
+    BaseCache = object
+
+# HDF5 metadata (superblock, object headers, B-tree nodes) is scattered in small pieces, so blocks stay small...
+METADATA_BLOCK_SIZE = 64 * 1024
+# ...while runs of sequential reads, i.e. contiguous dataset payloads, double their readahead up to this limit.
+MAX_READAHEAD_BYTES = 16 * 1024 * 1024
+# Least recently used blocks are dropped once the cache holds this many bytes.
+MAX_CACHED_BYTES = 256 * 1024 * 1024
+
+HDF5_CACHE_TYPE = 'hdf5-metadata'
+
+
+def is_url(path):
+    return '://' in str(path) and not str(path).startswith('file://')
+
+
+def file_size(path):
+    if not is_url(path):
+        return os.path.getsize(path)
+
+    fs, fs_path = fsspec.core.url_to_fs(path)
+    return fs.size(fs_path)
+
+
+def list_remote_files(url, suffix=".nwb"):
+    fs, fs_path = fsspec.core.url_to_fs(url)
+    return sorted(fs.unstrip_protocol(path) for path in fs.find(fs_path) if path.endswith(suffix))
+
+
+class HDF5MetadataCache(BaseCache):
+    name = HDF5_CACHE_TYPE
+
+    def __init__(self, blocksize, fetcher, size, max_readahead=MAX_READAHEAD_BYTES, max_cached=MAX_CACHED_BYTES):
+        super().__init__(blocksize, fetcher, size)
+        self.max_readahead = max_readahead
+        self.max_blocks = max(max_cached // blocksize, 1)
+        self.blocks = OrderedDict()
+        self.readahead_blocks = 0
+        self.last_stop = None
+        self.fetch_count = 0
+
+    def _fetch(self, start, stop):
+        start = 0 if start is None else start
+        stop = self.size if stop is None else min(stop, self.size)
+        if start >= stop:
+            return b""
+
+        first_block = start // self.blocksize
+        last_block = (stop - 1) // self.blocksize
+
+        if start == self.last_stop:
+            self.readahead_blocks = min(max(self.readahead_blocks * 2, 1), self.max_readahead // self.blocksize)
+        else:
+            self.readahead_blocks = 0
+        self.last_stop = stop
+
+        block_index = first_block
+        while block_index <= last_block:
+            if block_index in self.blocks:
+                self.hit_count += 1
+                self.blocks.move_to_end(block_index)
+                block_index += 1
+                continue
+
+            # Coalesce every consecutive missing block, plus any readahead, into a single ranged request.
+            run_end = block_index
+            while run_end + 1 <= last_block and run_end + 1 not in self.blocks:
+                run_end += 1
+            run_end = min(run_end + self.readahead_blocks, (self.size - 1) // self.blocksize)
+
+            self.fetch_blocks(block_index, run_end)
+            block_index = run_end + 1
+
+        data = b"".join(self.blocks[index] for index in range(first_block, last_block + 1))
+        offset = first_block * self.blocksize
+        return data[start - offset:stop - offset]
+
+    def fetch_blocks(self, first_block, last_block):
+        data = self.fetcher(first_block * self.blocksize, min((last_block + 1) * self.blocksize, self.size))
+
+        self.miss_count += 1
+        self.fetch_count += 1
+        self.total_requested_bytes += len(data)
+        for index in range(first_block, last_block + 1):
+            block_offset = (index - first_block) * self.blocksize
+            self.blocks[index] = data[block_offset:block_offset + self.blocksize]
+            self.blocks.move_to_end(index)
+
+        while len(self.blocks) > self.max_blocks:
+            self.blocks.popitem(last=False)
+
+
+if fsspec is not None:
+    register_cache(HDF5MetadataCache, clobber=True)
+
+
+class CountingFile(io.RawIOBase):
+    # Local counterpart of HDF5MetadataCache.total_requested_bytes, for measuring what validation actually reads.
+    def __init__(self, raw):
+        self.raw = raw
+        self.total_requested_bytes = 0
+
+    def readinto(self, buffer):
+        bytes_read = self.raw.readinto(buffer)
+        self.total_requested_bytes += bytes_read or 0
+        return bytes_read
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.raw.seek(offset, whence)
+
+    def tell(self):
+        return self.raw.tell()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        self.raw.close()
+        super().close()
+
+
+@contextmanager
+def open_remote(url, block_size=METADATA_BLOCK_SIZE, max_readahead=MAX_READAHEAD_BYTES, max_cached=MAX_CACHED_BYTES):
+    if fsspec is None:
+        raise ImportError("Validating remote files requires fsspec (and aiohttp for http/https URLs).")
+
+    fs, fs_path = fsspec.core.url_to_fs(url)
+    with fs.open(fs_path, 'rb', block_size=block_size, cache_type=HDF5_CACHE_TYPE,
+                 cache_options={'max_readahead': max_readahead, 'max_cached': max_cached}) as remote_file:
+        with h5py.File(remote_file, 'r') as h5_file:
+            yield h5_file, remote_file.cache
+
+
+@contextmanager
+def open_h5(path, count_reads=False):
+    # Yields the open file and its read counter: the block cache for URLs, a CountingFile for local files opened
+    # with count_reads (slower, h5py then reads through Python), otherwise None.
+    if is_url(path):
+        with open_remote(path) as (h5_file, remote_cache):
+            yield h5_file, remote_cache
+    elif count_reads:
+        with CountingFile(open(path, 'rb', buffering=0)) as counting_file:
+            with h5py.File(counting_file, 'r') as h5_file:
+                yield h5_file, counting_file
+    else:
+        with h5py.File(path, 'r') as h5_file:
+            yield h5_file, None
@@ -0,0 +1,72 @@
+import json
+
+from .validation import Issue
+
+# Parquet rows are buffered up to this many records before being flushed as a row group.
+PARQUET_BATCH_ROWS = 10000
+
+
+class JSONLReport:
+    def __init__(self, report_path):
+        self.report_file = open(report_path, 'w', encoding='utf-8')
+
+    def write(self, records):
+        for record in records:
+            self.report_file.write(json.dumps(record) + '\n')
+        self.report_file.flush()
+
+    def close(self):
+        self.report_file.close()
+
+
+class ParquetReport:
+    def __init__(self, report_path, batch_rows=PARQUET_BATCH_ROWS):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet reports require pyarrow. Install it or write a .jsonl report instead.")
+
+        self.pa = pa
+        self.batch_rows = batch_rows
+        self.buffer = []
+        self.schema = pa.schema([(field, pa.string()) for field in Issue._fields])
+        self.writer = pq.ParquetWriter(report_path, self.schema)
+
+    def write(self, records):
+        self.buffer += records
+        if len(self.buffer) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.writer.write_table(self.pa.Table.from_pylist(self.buffer, schema=self.schema))
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def open_report(report_path):
+    if report_path.endswith('.parquet'):
+        return ParquetReport(report_path)
+    elif report_path.endswith('.jsonl'):
+        return JSONLReport(report_path)
+    else:
+        raise ValueError(f"Unsupported report format: {report_path}. Use .jsonl or .parquet.")
+
+
+def rule_counts(report_path):
+    if report_path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        counts = pq.read_table(report_path, columns=['rule']).group_by('rule').aggregate([('rule', 'count')])
+        return dict(zip(counts['rule'].to_pylist(), counts['rule_count'].to_pylist()))
+
+    counts = {}
+    with open(report_path, 'r', encoding='utf-8') as report_file:
+        for line in report_file:
+            rule = json.loads(line)['rule']
+            counts[rule] = counts.get(rule, 0) + 1
+
+    return counts
@@ -0,0 +1,180 @@
+import time
+from collections import namedtuple
+
+import h5py
+
+from .profiles import load_profile
+
+Issue = namedtuple('Issue', ['file', 'module', 'interface', 'rule', 'severity', 'detail'])
+Rule = namedtuple('Rule', ['id', 'check', 'reads', 'after', 'severity', 'cost'])
+
+# Rule prefix of each validation section and the summary line reported when it raises no issues.
+SECTIONS = [
+    ('subject', "Subject: PASSED"),
+    ('acquisition', "Acquisitions: PASSED"),
+    ('processing', ".processing Modules: PASSED"),
+]
+
+# Every registered rule in declaration order, which is also the order issues are reported in.
+RULES = {}
+
+# Relative rule costs, fail-fast runs cheaper rules first.
+COST_METADATA = 1
+COST_SCAN = 3
+
+
+def rule(rule_id, reads=(), after=(), severity='error', cost=COST_METADATA):
+    def register(check):
+        RULES[rule_id] = Rule(rule_id, check, list(reads), list(after), severity, cost)
+        return check
+
+    return register
+
+
+class RuleContext:
+    def __init__(self, h5_file, values=None, fail_fast=False):
+        self.h5_file = h5_file
+        self.fail_fast = fail_fast
+        self.values = values if values is not None else {}
+        self.attr_cache = {}
+        self.children_cache = {}
+
+    def prefetch(self, patterns):
+        for pattern in patterns:
+            for path in expand_path(self.h5_file, pattern):
+                if path not in self.values:
+                    self.values[path] = read_value(self.h5_file[path])
+
+    def value(self, path):
+        return self.values.get(path)
+
+    def dataset(self, path):
+        return self.h5_file[path] if path in self.h5_file else None
+
+    def attrs(self, path):
+        if path not in self.attr_cache:
+            self.attr_cache[path] = dict(self.h5_file[path].attrs) if path in self.h5_file else {}
+
+        return self.attr_cache[path]
+
+    def children(self, path):
+        if path not in self.children_cache:
+            group = self.h5_file.get(path)
+            self.children_cache[path] = list(group.keys()) if isinstance(group, h5py.Group) else []
+
+        return self.children_cache[path]
+
+
+def read_value(dataset):
+    value = dataset[()]
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+
+    return value
+
+
+def expand_path(h5_file, pattern):
+    paths = ['']
+    for part in pattern.split('/'):
+        expanded = []
+        for path in paths:
+            group = h5_file[path] if path else h5_file
+            if not isinstance(group, h5py.Group):
+                continue
+
+            names = list(group.keys()) if part == '*' else [part] if part in group else []
+            expanded += [f"{path}/{name}" if path else name for name in names]
+
+        paths = expanded
+
+    return paths
+
+
+def plan_rules(rule_ids, fail_fast=False):
+    unknown_rules = [rule_id for rule_id in rule_ids if rule_id not in RULES]
+    if unknown_rules:
+        raise ValueError(f"Unknown validation rules: {', '.join(unknown_rules)}")
+
+    # Rules run once everything they are declared to run after has run; ties keep profile order, or go to the
+    # cheapest rule when failing fast.
+    ordered_rules = []
+    remaining_rules = list(rule_ids)
+    while remaining_rules:
+        ready_rules = [rule_id for rule_id in remaining_rules
+                       if all(dependency in ordered_rules or dependency not in rule_ids
+                              for dependency in RULES[rule_id].after)]
+        if not ready_rules:
+            raise ValueError(f"Circular rule dependencies between: {', '.join(remaining_rules)}")
+
+        next_rule = min(ready_rules, key=lambda rule_id: RULES[rule_id].cost) if fail_fast else ready_rules[0]
+        ordered_rules.append(next_rule)
+        remaining_rules.remove(next_rule)
+
+    return ordered_rules
+
+
+def record_timing(timings, rule_id, seconds, bytes_read):
+    rule_timing = timings.setdefault(rule_id, [0.0, 0])
+    rule_timing[0] += seconds
+    rule_timing[1] += bytes_read
+
+
+def merge_timings(timings, other_timings):
+    for rule_id, (seconds, bytes_read) in other_timings.items():
+        record_timing(timings, rule_id, seconds, bytes_read)
+
+
+def issue_order(issue):
+    section_index = [section for section, passed_line in SECTIONS].index(issue.rule.split('.')[0])
+    return section_index, issue.module or '', issue.interface or '', list(RULES).index(issue.rule)
+
+
+def run_rules(h5_file, profile=None, file=None, fail_fast=False, timings=None, read_counter=None):
+    # timings, if given, accumulates [seconds, bytes read] per rule; bytes are read off read_counter's
+    # total_requested_bytes, so they are only known for files opened through a counting reader.
+    profile_rules = load_profile(profile)['rules']
+    ordered_rules = plan_rules(list(profile_rules), fail_fast=fail_fast)
+
+    # Every dataset a rule declared is fetched once, right before its first use, and shared with later rules.
+    context = RuleContext(h5_file, fail_fast=fail_fast)
+
+    issues = []
+    for rule_id in ordered_rules:
+        params = profile_rules[rule_id]
+        severity = params.get('severity', RULES[rule_id].severity)
+        start_time = time.perf_counter()
+        start_bytes = read_counter.total_requested_bytes if read_counter is not None else 0
+
+        context.prefetch(RULES[rule_id].reads)
+        for module, interface, detail in RULES[rule_id].check(context, params):
+            issues.append(Issue(file, module, interface, rule_id, severity, detail))
+            if fail_fast and severity == 'error':
+                break
+
+        if timings is not None:
+            bytes_read = read_counter.total_requested_bytes - start_bytes if read_counter is not None else 0
+            record_timing(timings, rule_id, time.perf_counter() - start_time, bytes_read)
+
+        if fail_fast and any(issue.severity == 'error' for issue in issues):
+            break
+
+    # Reported by section, module and interface name, then in rule declaration order, whatever order the rules ran in.
+    return sorted(issues, key=issue_order)
+
+
+def summarize(issues, fail_fast=False):
+    # Warnings are reported but only errors make a file invalid.
+    is_valid = not any(issue.severity == 'error' for issue in issues)
+
+    summary_lines = []
+    for section, passed_line in SECTIONS:
+        section_lines = [issue.detail for issue in issues if issue.rule.startswith(f"{section}.")]
+        # A fail-fast run stops at its first error, so no other section can be reported as passed.
+        if fail_fast and not is_valid and not section_lines:
+            continue
+
+        summary_lines += section_lines or [passed_line]
+
+    summary = '\n '.join(summary_lines)
+
+    return is_valid, summary
@@ -0,0 +1,163 @@
+"""
+synthetic.py: Writes synthetic ndx-multichannel-volume NWB files shaped like the lab's recordings, for benchmarking.
+
+Usage:
+    synthetic.py -h | --help
+    synthetic.py <path> [options]
+
+Options:
+    -h --help                           show this message and exit.
+    --scale=<scale>                     one of small, medium or large. [default: small]
+    --seed=<seed>                       random seed. [default: 0]
+    --reference                         also write matching annotations.h5 and worldlines.h5 next to <path>.
+"""
+
+import os
+from datetime import datetime
+
+import h5py
+import numpy as np
+from dateutil import tz
+from docopt import docopt
+from hdmf.backends.hdf5.h5_utils import H5DataIO
+from hdmf.common import DynamicTable, VectorData
+from hdmf.data_utils import DataChunkIterator
+from ndx_multichannel_volume import CElegansSubject, OpticalChannelReferences, OpticalChannelPlus, ImagingVolume, \
+    MultiChannelVolume, MultiChannelVolumeSeries
+from pynwb import NWBFile, NWBHDF5IO
+from pynwb.misc import AnnotationSeries
+from pynwb.ophys import ImageSegmentation, PlaneSegmentation
+
+CHANNELS = ['BFP', 'CyOFP', 'GCaMP', 'RFP', 'mNeptune']
+NAMED_NEURONS = ['AWAL', 'I2L', 'AVAL', 'AVBL', 'AWAR', 'I2R', 'AVAR', 'AVBR', 'VB2']
+
+# NeuroPALImageRaw is (C, Z, X, Y) and CalciumImageSeries (T, X, Y, Z, C), matching what visualizer.py reads.
+SCALES = {
+    'small': {'neuropal_shape': (5, 21, 256, 64), 'calcium_shape': (100, 128, 32, 12, 3), 'n_neurons': 150,
+              'n_tracks': 150, 'n_stimuli': 6},
+    'medium': {'neuropal_shape': (5, 32, 512, 128), 'calcium_shape': (240, 160, 48, 16, 3), 'n_neurons': 200,
+               'n_tracks': 200, 'n_stimuli': 24},
+    'large': {'neuropal_shape': (5, 45, 1024, 256), 'calcium_shape': (1800, 256, 64, 21, 3), 'n_neurons': 250,
+              'n_tracks': 250, 'n_stimuli': 60},
+}
+
+
+def neuron_names(n_neurons):
+    return [NAMED_NEURONS[i] if i < len(NAMED_NEURONS) else f"N{i}" for i in range(n_neurons)]
+
+
+def imaging_volume(name, device):
+    channels = [OpticalChannelPlus(name=channel, description=channel, emission_lambda=500.,
+                                   emission_range=[480., 520.], excitation_lambda=450.,
+                                   excitation_range=[440., 460.]) for channel in CHANNELS]
+
+    volume = ImagingVolume(name=name, description=name, device=device, location='head', optical_channel_plus=channels,
+                           order_optical_channels=OpticalChannelReferences(name='order_optical_channels',
+                                                                           channels=CHANNELS),
+                           grid_spacing=[0.4, 0.4, 1.5], grid_spacing_unit='um', origin_coords=[0., 0., 0.],
+                           origin_coords_unit='um', reference_frame='head')
+    # ImagingVolume leaves the optical_channel its ImagingPlane spec requires empty, the channels fill it in.
+    volume.optical_channel.extend(channels)
+    return volume
+
+
+def calcium_frames(calcium_shape, rng):
+    # One frame at a time, so even the large scale never holds the whole series in memory.
+    for _ in range(calcium_shape[0]):
+        yield rng.integers(0, 4096, size=calcium_shape[1:], dtype=np.uint16)
+
+
+def write_synthetic_nwb(filepath, neuropal_shape=(5, 21, 256, 64), calcium_shape=(100, 128, 32, 12, 3),
+                        n_neurons=150, n_tracks=150, n_stimuli=6, seed=0):
+    rng = np.random.default_rng(seed)
+    n_frames = calcium_shape[0]
+    names = neuron_names(n_neurons)
+
+    nwbfile = NWBFile(session_description='synthetic', identifier=os.path.basename(filepath),
+                      session_start_time=datetime(2024, 1, 1, tzinfo=tz.tzlocal()))
+    nwbfile.subject = CElegansSubject(subject_id='sub-20240101-h1', description='synthetic', sex='O',
+                                      species='http://purl.obolibrary.org/obo/NCBITaxon_6239', strain='OH15500',
+                                      growth_stage='YA')
+    device = nwbfile.create_device(name='Microscope')
+
+    volumes = {}
+    for name in ['NeuroPALImVol', 'CalciumImVol']:
+        volumes[name] = imaging_volume(name, device)
+        nwbfile.add_imaging_plane(volumes[name])
+
+    neuropal = rng.integers(0, 4096, size=neuropal_shape, dtype=np.uint16)
+    nwbfile.add_acquisition(MultiChannelVolume(name='NeuroPALImageRaw', imaging_volume=volumes['NeuroPALImVol'],
+                                               description='synthetic', RGBW_channels=[1, 2, 3, 4],
+                                               data=H5DataIO(neuropal, chunks=True)))
+
+    calcium = DataChunkIterator(data=calcium_frames(calcium_shape, rng), maxshape=calcium_shape,
+                                dtype=np.dtype(np.uint16), buffer_size=1)
+    nwbfile.add_acquisition(MultiChannelVolumeSeries(name='CalciumImageSeries', imaging_volume=volumes['CalciumImVol'],
+                                                     data=H5DataIO(calcium, chunks=(1, *calcium_shape[1:])),
+                                                     unit='n/a', rate=4.0, device=device,
+                                                     dimension=list(calcium_shape[1:4])))
+
+    neuropal_module = nwbfile.create_processing_module(name='NeuroPAL', description='NeuroPAL')
+    segmentation = ImageSegmentation(name='NeuroPALSegmentation')
+    neurons = PlaneSegmentation(name='NeuroPALNeurons', description='NeuroPAL neurons',
+                                imaging_plane=volumes['NeuroPALImVol'])
+    neurons.add_column('ID_labels', 'NeuroPAL ID labels')
+    for name in names:
+        voxel = [int(rng.integers(0, neuropal_shape[2])), int(rng.integers(0, neuropal_shape[3])),
+                 int(rng.integers(0, neuropal_shape[1])), 1.0]
+        neurons.add_roi(voxel_mask=[voxel], ID_labels=name)
+    segmentation.add_plane_segmentation(neurons)
+    neuropal_module.add(segmentation)
+
+    tracked = ImageSegmentation(name='TrackedNeurons')
+    tracks = PlaneSegmentation(name='TrackedNeuronROIs', description='Tracked neurons',
+                               imaging_plane=volumes['CalciumImVol'])
+    for _ in range(n_tracks):
+        tracks.add_roi(voxel_mask=[[int(rng.integers(1, calcium_shape[1])), int(rng.integers(1, calcium_shape[2])),
+                                    int(rng.integers(1, calcium_shape[3])), 1.0]])
+    tracked.add_plane_segmentation(tracks)
+    neuropal_module.add(tracked)
+    neuropal_module.add(DynamicTable(name='NeuroPAL_ID', description='NeuroPAL ID settings', columns=[
+        VectorData(name='gammas', description='Channel gammas', data=rng.uniform(0.8, 1.2, neuropal_shape[0]))]))
+
+    calcium_module = nwbfile.create_processing_module(name='CalciumActivity', description='Calcium activity')
+    stimulus_timestamps = np.sort(rng.choice(n_frames, min(n_stimuli, n_frames), replace=False)).astype(float)
+    calcium_module.add(AnnotationSeries(name='StimulusInfo', timestamps=stimulus_timestamps,
+                                        data=[f"stimulus{i % 3}" for i in range(len(stimulus_timestamps))]))
+    calcium_module.add(DynamicTable(name='ActivityTraces', description='Activity traces', columns=[
+        VectorData(name='neuron', description='Neuron name', data=names),
+        VectorData(name='activity', description='Activity trace', data=rng.random((n_neurons, n_frames)) * 100)]))
+
+    with NWBHDF5IO(filepath, 'w') as write_io:
+        write_io.write(nwbfile)
+
+
+def write_synthetic_reference(reference_path, n_tracks=150, n_frames=100, seed=0):
+    # The annotations.h5 / worldlines.h5 pair fixer.fix_track reads: one annotation per worldline per frame.
+    rng = np.random.default_rng(seed)
+    names = neuron_names(n_tracks)
+    os.makedirs(reference_path, exist_ok=True)
+
+    with h5py.File(os.path.join(reference_path, 'worldlines.h5'), 'w') as worldlines:
+        worldlines.create_dataset('id', data=np.arange(n_tracks))
+        worldlines.create_dataset('name', data=np.array(names, dtype='S'))
+
+    with h5py.File(os.path.join(reference_path, 'annotations.h5'), 'w') as annotations:
+        n_annotations = n_tracks * n_frames
+        for axis in ['x', 'y', 'z']:
+            annotations.create_dataset(axis, data=rng.random(n_annotations, dtype=np.float32))
+        annotations.create_dataset('t_idx', data=np.repeat(np.arange(n_frames), n_tracks))
+        annotations.create_dataset('worldline_id', data=np.tile(rng.permutation(n_tracks), n_frames))
+
+
+def write_synthetic_scale(filepath, scale='small', seed=0, reference=False):
+    write_synthetic_nwb(filepath, seed=seed, **SCALES[scale])
+    if reference:
+        write_synthetic_reference(os.path.dirname(os.path.abspath(filepath)), n_tracks=SCALES[scale]['n_tracks'],
+                                  n_frames=SCALES[scale]['calcium_shape'][0], seed=seed)
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__, version='Synthetic NWB Writer')
+
+    write_synthetic_scale(args['<path>'], args['--scale'], int(args['--seed']), args['--reference'])
@@ -1,124 +1,87 @@
-import math
+import hashlib
+import json
+from contextlib import contextmanager
 
-import numpy as np
-import pynwb.misc
-import pynwb.ophys
-import hdmf.common.table
+import h5py
+from pynwb import NWBHDF5IO
 
+from . import h5_validation
+from .profiles import load_profile
+from .remote import open_h5
+from .rules import SECTIONS, Issue, run_rules, summarize
 
-def validate_subject(nwb_obj):
-    expected_sexes = ['O', 'X']
-    expected_species = 'http://purl.obolibrary.org/obo/NCBITaxon_6239'
+# Bump whenever a rule changes so that cached validation results are invalidated.
+RULESET_VERSION = '7'
 
-    issue_list = []
 
-    if nwb_obj.subject.sex not in expected_sexes:
-        issue_list.append('Sex: invalid')
+def ruleset_version(profile=None):
+    profile_rules = load_profile(profile)['rules']
+    digest = hashlib.sha1(json.dumps(profile_rules, sort_keys=True).encode('utf-8')).hexdigest()
+    return f"{RULESET_VERSION}-{digest[:12]}"
 
-    if nwb_obj.subject.species != expected_species:
-        issue_list.append('Species: invalid')
 
-    if nwb_obj.subject.strain == "[]":
-        issue_list.append('Strain: not specified')
+@contextmanager
+def nwb_h5_file(nwb_obj):
+    # pynwb has already checked that the object graph can be built, the rules of h5_validation then run over its HDF5
+    # file, sharing their read planning, dependency order and fail-fast ordering with --fast. That is the file an
+    # object was read from, so changes made to it in memory since are only validated once it is written or exported,
+    # while an object built in memory is written to an in-memory HDF5 file first.
+    h5_file = getattr(nwb_obj.read_io, '_file', None) if nwb_obj.read_io is not None else None
+    if h5_file is not None:
+        yield h5_file
+        return
 
-    if not issue_list:
-        return ["Subject: PASSED"]
-    else:
-        return issue_list
+    with h5py.File(f"{nwb_obj.identifier}.nwb", 'w', driver='core', backing_store=False) as h5_file:
+        with NWBHDF5IO(file=h5_file, mode='w') as write_io:
+            write_io.write(nwb_obj)
+            yield h5_file
 
 
-def validate_acquisitions(nwb_obj):
-    expected_keys = ['CalciumImageSeries', 'NeuroPALImageRaw']
-    expected_grid_spacing = [0.4, 0.4, 1.5]
-    expected_channels = ['BFP', 'CyOFP', 'GCaMP', 'RFP', 'mNeptune']
+def iter_section_issues(nwb_obj, section, profile=None):
+    profile_rules = load_profile(profile)['rules']
+    section_profile = {'rules': {rule_id: params for rule_id, params in profile_rules.items()
+                                 if rule_id.startswith(f"{section}.")}}
+    return iter_issues(nwb_obj, profile=section_profile)
 
-    issue_list = []
 
-    acquisition_modules = list(nwb_obj.acquisition.keys())
-    if acquisition_modules != expected_keys:
-        issue_list.append('acquisition keys')
+def iter_subject_issues(nwb_obj, profile=None):
+    return iter_section_issues(nwb_obj, 'subject', profile)
 
-    for each_acquisition_module in acquisition_modules:
-        module_obj = nwb_obj.acquisition[each_acquisition_module]
-        if any(module_obj.imaging_volume.grid_spacing[:] != expected_grid_spacing):
-            issue_list.append(f"{each_acquisition_module} grid_spacing")
 
-        channels = module_obj.imaging_volume.optical_channel
-        for each_channel in channels:
-            if (
-                    each_channel.name not in expected_channels
-                    or any(each_channel.emission_range[:] == [0, 0])
-                    or each_channel.emission_lambda == 0
-                    or any(each_channel.excitation_range[:] == [0, 0])
-                    or each_channel.excitation_lambda == 0
-            ):
-                issue_list.append(f"{each_acquisition_module}: channel {each_channel.name} contains filler info")
+def iter_acquisition_issues(nwb_obj, profile=None):
+    return iter_section_issues(nwb_obj, 'acquisition', profile)
 
-    if not issue_list:
-        return ["Acquisitions: PASSED"]
-    else:
-        return issue_list
 
+def iter_processed_issues(nwb_obj, profile=None):
+    return iter_section_issues(nwb_obj, 'processing', profile)
 
-def validate_processed(nwb_obj):
-    expected_keys = ['CalciumActivity', 'NeuroPAL']
-    expected_calcium_data = ['StimulusInfo', 'TrackedNeurons', 'ActivityTraces']
-    expected_neuropal_data = ['NeuroPALSegmentation', 'TrackedNeurons', 'NeuroPAL_ID']
 
-    issue_list = []
+def iter_issues(nwb_obj, file=None, profile=None, fail_fast=False, timings=None):
+    with nwb_h5_file(nwb_obj) as h5_file:
+        yield from run_rules(h5_file, profile=profile, file=file, fail_fast=fail_fast, timings=timings)
 
-    for module_name, processing_module in nwb_obj.processing.items():
-        if module_name not in expected_keys:
-            issue_list.append(f"Unexpected processing key: {module_name}")
 
-        data_interfaces = list(processing_module.data_interfaces.keys())
+def validate_subject(nwb_obj, profile=None):
+    return [issue.detail for issue in iter_subject_issues(nwb_obj, profile)] or ["Subject: PASSED"]
 
-        for interface_name, each_child in processing_module.data_interfaces.items():
-            if isinstance(each_child, hdmf.common.table.DynamicTable):
-                if "Activity" in each_child.colnames:
-                    activity_column = each_child["Activity"]  # Access the column properly
-                    if any(math.isnan(val) for val in activity_column.data):
-                        issue_list.append(f"{module_name} {interface_name} contains NaN values in Activity column")
 
-            elif isinstance(each_child, pynwb.misc.AnnotationSeries):
-                if each_child.data.shape != each_child.timestamps.shape:
-                    issue_list.append(f"{module_name} {interface_name} data/timestamp dim mismatch")
+def validate_acquisitions(nwb_obj, profile=None):
+    return [issue.detail for issue in iter_acquisition_issues(nwb_obj, profile)] or ["Acquisitions: PASSED"]
 
-            elif isinstance(each_child, pynwb.ophys.ImageSegmentation):
-                if each_child.name == 'TrackedNeurons':
-                    tracked_rois = np.array(each_child['TrackedNeuronROIs'].voxel_mask[:].tolist())
-                    if tracked_rois.shape[1] < 3:
-                        issue_list.append(f"{module_name} {interface_name} ROI compressed along time dimension")
 
-                    non_zero = (tracked_rois > 0).any(axis=(0, 1))
-                    if not non_zero:
-                        issue_list.append(f"{module_name} {interface_name} ROI has all-zero slices along dimensions")
+def validate_processed(nwb_obj, profile=None):
+    return [issue.detail for issue in iter_processed_issues(nwb_obj, profile)] or [".processing Modules: PASSED"]
 
-            else:
-                issue_list.append(f"{module_name} unexpected child class: {type(each_child).__name__}")
 
-    if not issue_list:
-        return [".processing Modules: PASSED"]
-    else:
-        return issue_list
+def validate_path(filepath, profile=None, fail_fast=False):
+    # Local paths and fsspec URLs (http(s)://, s3://, ...) alike; remote files are read through a metadata block cache.
+    with open_h5(filepath) as (h5_file, remote_cache):
+        with NWBHDF5IO(file=h5_file, mode='r') as read_io:
+            return validate(read_io.read(), profile, fail_fast)
 
 
-def validate(nwb_obj):
-    issue_list = []
+def validate(nwb_obj, profile=None, fail_fast=False):
+    if isinstance(nwb_obj, str):
+        return validate_path(nwb_obj, profile, fail_fast)
 
-    subject_issues = validate_subject(nwb_obj)
-    if len(subject_issues) > 0:
-        issue_list += subject_issues
-
-    acquisition_issues = validate_acquisitions(nwb_obj)
-    if len(acquisition_issues) > 0:
-        issue_list += acquisition_issues
-
-    processing_issues = validate_processed(nwb_obj)
-    if len(processing_issues) > 0:
-        issue_list += processing_issues
-
-    is_valid = len(issue_list) == 0
-    summary = '\n '.join(issue_list)
-
-    return is_valid, summary
\ No newline at end of file
+    return summarize(list(iter_issues(nwb_obj, profile=profile, fail_fast=fail_fast)), fail_fast)
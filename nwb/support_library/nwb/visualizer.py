@@ -1,13 +1,39 @@
+import itertools
 import os
+import shutil
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import h5py
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import matplotlib.patches as mpatches
+from matplotlib.collections import LineCollection
 from matplotlib.patches import ConnectionPatch
+from hdmf.common import VectorIndex
+from .helper import MIP_MEMORY_BYTES, decimated_trace, decimation_pyramid, iter_frame_projections, max_projection, \
+    voxel_mask_array
+from .multiscale import multiscale_level
+from .neurons import neuron_rows, target_neurons
 from .validation import validate
 from datetime import datetime
 import warnings
 
+# Projected RGB images and activity decimation pyramids by (file, dataset, mtime, size), most recently used last.
+MIP_MEMO = OrderedDict()
+PYRAMID_MEMO = OrderedDict()
+MEMO_SIZE = 16
+MIP_SIDECAR_SUFFIX = '.mip.npz'
+PYRAMID_SIDECAR_SUFFIX = '.activity.npz'
+# Frames, or min/max bins of long recordings, drawn per pixel of an activity subplot's width.
+TRACE_BINS_PER_PIXEL = 2
+
+VIDEO_FPS = 10
+# Frames of CalciumImageSeries rendered by default.
+VIDEO_FRAMES = slice(1, 75)
+VIDEO_THREADS = min(os.cpu_count() or 1, 8)
+
 
 def plot_subject_info(ax, nwb_obj):
     ax.axis('off')
@@ -29,33 +55,33 @@ def plot_subject_info(ax, nwb_obj):
     ax.text(1, 0.5, val_text, ha='right', va='center', fontsize=7, transform=ax.transAxes)
 
 
-def plot_worm(ax, nwb_obj):
-    rgb_img = generate_mip(nwb_obj)
+def plot_worm(ax, nwb_obj, mip_sidecar=False):
+    rgb_img = cached_mip(nwb_obj, mip_sidecar, mip_output_size(ax, nwb_obj))
     warnings.filterwarnings("ignore")
-    ax.imshow((rgb_img * 255).astype(np.uint16), origin='lower')
+    ax.imshow((rgb_img * 255).astype(np.uint16), origin='lower', extent=mip_extent(nwb_obj))
     ax.set_title(f"{nwb_obj.subject.subject_id} Colorstack MIP", fontsize=10)
     ax.axis('off')
 
 
-def plot_neurons(ax, nwb_obj):
-    target_neurons = ['AWAL', 'I2L', 'AVAL', 'AVBL', 'AWAR', 'I2R', 'AVAR', 'AVBR', 'VB2']
+def plot_neurons(ax, nwb_obj, mip_sidecar=False, targets=None):
+    targets = target_neurons(targets)
     neurons = nwb_obj.processing['NeuroPAL']['NeuroPALSegmentation']['NeuroPALNeurons']
-    neuron_positions = np.array(neurons.voxel_mask[:].tolist())
-    neuron_labels = np.array(neurons.ID_labels)
+    neuron_positions = voxel_mask_array(neurons.voxel_mask)
+    neuropal_rows = neuron_rows(nwb_obj, 'neuropal')
 
     x_coords = neuron_positions[:, 0]
     y_coords = neuron_positions[:, 1]
 
-    mask = np.isin(neuron_labels, target_neurons)
-    target_positions = neuron_positions[mask, :2]
-    target_labels = neuron_labels[mask]
+    target_rows = sorted((row, name) for name in dict.fromkeys(targets) for row in neuropal_rows.get(name, []))
+    target_positions = neuron_positions[[row for row, _ in target_rows], :2]
+    target_labels = np.array([name for _, name in target_rows])
     if len(target_positions) > 0:
         sorted_indices = np.argsort(target_positions[:, 1])
         target_positions = target_positions[sorted_indices]
         target_labels = target_labels[sorted_indices]
 
-    rgb_img = generate_mip(nwb_obj)
-    ax.imshow((rgb_img * 255).astype(np.uint16), origin='lower')
+    rgb_img = cached_mip(nwb_obj, mip_sidecar, mip_output_size(ax, nwb_obj))
+    ax.imshow((rgb_img * 255).astype(np.uint16), origin='lower', extent=mip_extent(nwb_obj))
     ax.scatter(x_coords, y_coords, facecolors='none', edgecolors='r', s=20, alpha=0.6)
 
     if len(target_positions) > 0:
@@ -73,7 +99,7 @@ def plot_neurons(ax, nwb_obj):
                                   arrowstyle='-', color='red', linewidth=0.5, alpha=1)
             ax.add_artist(con)
 
-    missing_neurons = [t for t in target_neurons if t not in neuron_labels]
+    missing_neurons = [t for t in targets if t not in neuropal_rows]
 
     if len(missing_neurons) > 0:
         missing_text = "MISSING: " + ", ".join(missing_neurons)
@@ -81,27 +107,50 @@ def plot_neurons(ax, nwb_obj):
                 ha='left', va='bottom', transform=ax.transAxes,
                 bbox=dict(facecolor='black', alpha=0.5, edgecolor='none', pad=1))
 
-    ax.set_title(f"{nwb_obj.subject.subject_id} Neurons ({len(neuron_labels)})", fontsize=10)
+    ax.set_title(f"{nwb_obj.subject.subject_id} Neurons ({len(neuron_positions)})", fontsize=10)
     ax.axis('off')
 
 
-def plot_activity(ax, nwb_obj):
-    target_neurons = ['AWAL', 'I2L', 'AVAL', 'AVBL', 'AWAR', 'I2R', 'AVAR', 'AVBR', 'VB2']
+def stimulus_label_strip(stimulus_labels, stimulus_timestamps, stimulus_colors, num_frames):
+    # Each stimulus shades from its timestamp up to the next one, the last up to the end of the recording.
+    if len(stimulus_labels) == 0:
+        return None
+
+    edges = np.maximum.accumulate(np.append(np.asarray(stimulus_timestamps, dtype=float), num_frames))
+    colors = np.array([stimulus_colors[label] for label in stimulus_labels])
+    colors[:, 3] = 0.4
+    return edges, colors[np.newaxis]
+
+
+def activity_array(activity_module, activity_rows):
+    # The (neurons, frames) activity data and the row of each neuron within it. A ragged activity column, stored with
+    # an index, is read one neuron at a time and padded with NaN to the longest trace.
+    activity_column = activity_module['activity']
+    if isinstance(activity_column, VectorIndex):
+        traces = [np.asarray(activity_column[row], dtype=float) for row in activity_rows.values()]
+        activity_data = np.full((len(traces), max((len(trace) for trace in traces), default=1)), np.nan)
+        for row, trace in enumerate(traces):
+            activity_data[row, :len(trace)] = trace
+        return activity_data, dict(zip(activity_rows, range(len(traces))))
+
+    activity_data = activity_column.data
+    if not hasattr(activity_data, 'shape'):
+        activity_data = np.asarray(activity_data, dtype=float)
+    if activity_data.ndim != 2:
+        raise ValueError(f"ActivityTraces activity is expected to hold one trace per neuron, got shape "
+                         f"{activity_data.shape}.")
+
+    return activity_data, activity_rows
+
+
+def plot_activity(ax, nwb_obj, activity_sidecar=False, targets=None):
+    targets = target_neurons(targets)
     activity_module = nwb_obj.processing['CalciumActivity']['ActivityTraces']
-    activity_dict = {}
-    for n, neuron_name in enumerate(activity_module.neuron):
-        if neuron_name in target_neurons:
-            activity_dict[neuron_name] = activity_module.activity[n]
+    activity_index = neuron_rows(nwb_obj, 'activity')
+    activity_rows = {neuron: activity_index[neuron][0] for neuron in targets if neuron in activity_index}
 
-    if activity_dict:
-        activity_values = list(activity_dict.values())
-        all_vals = np.concatenate(activity_values)
-        all_vals = [x for x in all_vals if not np.isnan(x)]
-        ymin, ymax = 0, np.max(all_vals)
-        num_frames = max(len(a) for a in activity_values)
-    else:
-        ymin, ymax = 0, 1
-        num_frames = 1  # fallback if no data
+    activity_data, activity_rows = activity_array(activity_module, activity_rows)
+    num_frames = activity_data.shape[1] if activity_rows else 1
 
     # Get stimulus info
     stimulus_labels = nwb_obj.processing['CalciumActivity']['StimulusInfo'].data[:]
@@ -109,8 +158,9 @@ def plot_activity(ax, nwb_obj):
 
     # Identify unique stimuli and assign colors
     unique_stimuli = np.unique(stimulus_labels)
-    cmap = plt.cm.get_cmap('tab10', len(unique_stimuli))
+    cmap = plt.get_cmap('tab10', len(unique_stimuli))
     stimulus_colors = {label: cmap(i) for i, label in enumerate(unique_stimuli)}
+    stimulus_strip = stimulus_label_strip(stimulus_labels, stimulus_timestamps, stimulus_colors, num_frames)
 
     # Turn off the original axis and get its SubplotSpec
     ax.set_axis_off()
@@ -121,29 +171,36 @@ def plot_activity(ax, nwb_obj):
     # Increase the ratio so the legend space is relatively smaller
     main_gs = main_spec.subgridspec(1, 2, width_ratios=[10, 2], wspace=0.1)
 
-    # Left side: 3x3 grid of activity plots with minimal spacing
-    plot_gs = main_gs[0, 0].subgridspec(3, 3, hspace=0.3, wspace=0.1)
-    axs = [fig.add_subplot(plot_gs[i // 3, i % 3]) for i in range(9)]
+    # Left side: square-ish grid of activity plots with minimal spacing, 3x3 for the default targets
+    n_cols = max(int(np.ceil(np.sqrt(len(targets)))), 1)
+    n_rows = max(-(-len(targets) // n_cols), 1)
+    plot_gs = main_gs[0, 0].subgridspec(n_rows, n_cols, hspace=0.3, wspace=0.1)
+    axs = [fig.add_subplot(plot_gs[i // n_cols, i % n_cols]) for i in range(n_rows * n_cols)]
 
     # Right side: single cell for legend
     legend_ax = fig.add_subplot(main_gs[0, 1])
     legend_ax.axis('off')
 
+    # Long traces are drawn from the decimation pyramid at about the subplots' resolution, whatever their length.
+    max_bins = int(axs[0].get_window_extent().width * TRACE_BINS_PER_PIXEL)
+    pyramid = cached_pyramid(activity_data, activity_sidecar) if activity_rows and num_frames > max_bins else []
+    activity_dict = {neuron: decimated_trace(activity_data, pyramid, row, max_bins)
+                     for neuron, row in activity_rows.items()}
+
+    if activity_dict:
+        all_vals = np.concatenate([fluo for _, fluo in activity_dict.values()])
+        ymin, ymax = 0, np.nanmax(all_vals) if not np.isnan(all_vals).all() else 1
+    else:
+        ymin, ymax = 0, 1
+
     # Shade and plot each neuron
-    for idx, neuron in enumerate(target_neurons):
+    for idx, neuron in enumerate(targets):
         subax = axs[idx]
-        # Shade background according to stimuli
-        for i in range(len(stimulus_labels)):
-            start = stimulus_timestamps[i]
-            end = stimulus_timestamps[i + 1] if i < len(stimulus_labels) - 1 else num_frames
-            subax.axvspan(start, end, facecolor=stimulus_colors[stimulus_labels[i]], alpha=0.4)
-
         if neuron in activity_dict:
-            fluo = activity_dict[neuron]
-            subax.plot(fluo, linewidth=0.5, c='r')
-            valid_fluo = [x for x in fluo if not np.isnan(x)]
-            if valid_fluo:
-                subax.set_ylim(ymin, np.max(valid_fluo) + 5)
+            frames, fluo = activity_dict[neuron]
+            subax.add_collection(LineCollection([np.column_stack([frames, fluo])], linewidths=0.5, colors='r'))
+            if not np.isnan(fluo).all():
+                subax.set_ylim(ymin, np.nanmax(fluo) + 5)
             else:
                 subax.set_ylim(ymin, ymax)
         else:
@@ -154,17 +211,23 @@ def plot_activity(ax, nwb_obj):
                        transform=subax.transAxes, color='black', fontsize=6)
             subax.set_ylim(ymin, ymax)
 
+        # Shade background according to stimuli, as one image spanning the whole y range
+        if stimulus_strip is not None:
+            strip = subax.pcolorfast(stimulus_strip[0], subax.get_ylim(), stimulus_strip[1], rasterized=True, zorder=0)
+            strip.sticky_edges.x.clear()
+        subax.autoscale_view(scaley=False)
+
         subax.set_title(neuron, fontsize=8)
 
         # Only label y-axis on left column
-        if idx % 3 != 0:
+        if idx % n_cols != 0:
             subax.set_ylabel('')
             subax.yaxis.set_ticklabels([])
         else:
             subax.set_ylabel('Fluorescence', fontsize=6)
 
-        # Only label x-axis on bottom row
-        if idx < 6:
+        # Only label x-axis on the lowest plot of each column
+        if idx + n_cols < len(targets):
             subax.set_xlabel('')
             subax.xaxis.set_ticklabels([])
         else:
@@ -172,8 +235,8 @@ def plot_activity(ax, nwb_obj):
 
         subax.tick_params(axis='both', which='major', labelsize=6)
 
-    # Turn off axes for unused subplots if fewer than 9 target_neurons
-    for j in range(len(target_neurons), 9):
+    # Turn off axes for unused subplots if the targets do not fill the grid
+    for j in range(len(targets), len(axs)):
         axs[j].axis('off')
 
     # Create a compact legend on the right with smaller font
@@ -181,72 +244,327 @@ def plot_activity(ax, nwb_obj):
     legend_ax.legend(handles=legend_handles, loc='right', ncol=1, fontsize=5)
 
 
-def generate_mip(nwb_obj):
-    color_stack = nwb_obj.acquisition['NeuroPALImageRaw'].data[:]
+def generate_mip(nwb_obj, memory_budget=MIP_MEMORY_BYTES, output_size=None):
+    # Given an (x, y) output_size, projects the coarsest exported multiscale level that still covers it.
+    color_stack = multiscale_level(nwb_obj.acquisition['NeuroPALImageRaw'].data, output_size)
     rgbw_indices = nwb_obj.acquisition['NeuroPALImageRaw'].RGBW_channels[:] - 1
     channel_gammas = nwb_obj.processing['NeuroPAL']['NeuroPAL_ID'].gammas[:]
     if color_stack.ndim < 4:
         print("Data format not as expected.")
         return np.zeros((100, 100, 3))
-    max_img = color_stack.max(axis=1)
+    # Streamed in z-slabs of the RGB channels only, so the full volume is never held in memory.
+    max_img = max_projection(color_stack, rgbw_indices[:3], memory_budget)
     rgb_img = np.zeros((max_img.shape[2], max_img.shape[1], 3), dtype=float)
     for i, chan_idx in enumerate(rgbw_indices[:3]):
-        gamma = channel_gammas[chan_idx]
-        channel_data = max_img[chan_idx, ...].astype(float)
-        max_val = channel_data.max() if channel_data.max() != 0 else 1
-        channel_data /= max_val
-        channel_data = np.power(channel_data, 1.0 / gamma)
-        channel_data *= max_val
-        rgb_img[..., i] = channel_data.T
+        rgb_img[..., i] = gamma_correct(max_img[i, ...], channel_gammas[chan_idx]).T
     return rgb_img
 
 
-def visualize(nwb_obj):
+def gamma_correct(channel_data, gamma):
+    max_val = channel_data.max() if channel_data.max() != 0 else 1
+    if channel_data.dtype in (np.uint8, np.uint16):
+        # One table entry per value up to the channel max, applied with a single gather.
+        lut = np.arange(int(max_val) + 1, dtype=float)
+        lut /= max_val
+        lut = np.power(lut, 1.0 / gamma)
+        lut *= max_val
+        return lut[channel_data]
+
+    channel_data = channel_data.astype(np.float32)
+    channel_data /= np.float32(max_val)
+    np.power(channel_data, np.float32(1.0 / gamma), out=channel_data)
+    channel_data *= np.float32(max_val)
+    return channel_data
+
+
+def dataset_key(data):
+    if not isinstance(data, h5py.Dataset):
+        return None
+
+    try:
+        filepath = os.path.abspath(data.file.filename)
+        stat = os.stat(filepath)
+    except OSError:
+        # In-memory and remote files have nothing on disk to key on.
+        return None
+
+    return filepath, data.name, stat.st_mtime, stat.st_size
+
+
+def mip_key(nwb_obj, output_size=None):
+    # A MIP projected from a multiscale level is keyed apart from the full resolution one, in memory and in sidecars.
+    data = nwb_obj.acquisition['NeuroPALImageRaw'].data
+    key = dataset_key(data)
+    level_data = multiscale_level(data, output_size)
+    if key is None or level_data is data:
+        return key
+
+    return key[0], f"{key[1]}@{level_data.shape[2]}x{level_data.shape[3]}", *key[2:]
+
+
+def read_sidecar(key, suffix):
+    try:
+        with np.load(key[0] + suffix) as sidecar:
+            if (str(sidecar['dataset']), float(sidecar['mtime']), int(sidecar['size'])) == key[1:]:
+                return {name: sidecar[name] for name in sidecar.files if name not in ['dataset', 'mtime', 'size']}
+    except (OSError, KeyError, ValueError):
+        pass
+
+    return None
+
+
+def write_sidecar(key, suffix, arrays):
+    sidecar_path = key[0] + suffix
+    tmp_path = f"{sidecar_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as tmp_file:
+            np.savez(tmp_file, dataset=key[1], mtime=key[2], size=key[3], **arrays)
+        os.replace(tmp_path, sidecar_path)
+    except OSError:
+        # A read-only data directory just means no sidecar.
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def memoized(memo, key, compute, sidecar_suffix=None):
+    # compute() returns a dict of arrays, memoized in process under key and, given a suffix, in a sidecar next to the
+    # file that outlives the process.
+    if key is None:
+        return compute()
+
+    if key in memo:
+        memo.move_to_end(key)
+        return memo[key]
+
+    arrays = read_sidecar(key, sidecar_suffix) if sidecar_suffix else None
+    if arrays is None:
+        arrays = compute()
+        if sidecar_suffix:
+            write_sidecar(key, sidecar_suffix, arrays)
+
+    memo[key] = arrays
+    while len(memo) > MEMO_SIZE:
+        memo.popitem(last=False)
+
+    return arrays
+
+
+def cached_mip(nwb_obj, sidecar=False, output_size=None):
+    return memoized(MIP_MEMO, mip_key(nwb_obj, output_size),
+                    lambda: {'rgb_img': generate_mip(nwb_obj, output_size=output_size)},
+                    MIP_SIDECAR_SUFFIX if sidecar else None)['rgb_img']
+
+
+def cached_pyramid(activity_data, sidecar=False):
+    # Levels of the min/max decimation pyramid of a (neurons, frames) ActivityTraces activity dataset.
+    arrays = memoized(PYRAMID_MEMO, dataset_key(activity_data), lambda: pyramid_arrays(activity_data),
+                      PYRAMID_SIDECAR_SUFFIX if sidecar else None)
+    return [(arrays[f"mins{level}"], arrays[f"maxs{level}"]) for level in range(len(arrays) // 2)]
+
+
+def pyramid_arrays(activity_data):
+    arrays = {}
+    for level, (mins, maxs) in enumerate(decimation_pyramid(activity_data)):
+        arrays[f"mins{level}"], arrays[f"maxs{level}"] = mins, maxs
+
+    return arrays
+
+
+def axes_output_size(ax, x_size, y_size):
+    # (x, y) pixels an x_size by y_size image fills once drawn into ax at equal aspect.
+    bbox = ax.get_window_extent()
+    scale = min(bbox.width / x_size, bbox.height / y_size)
+    return int(np.ceil(x_size * scale)), int(np.ceil(y_size * scale))
+
+
+def video_output_size(ax_video, nwb_obj):
+    shape = nwb_obj.acquisition['CalciumImageSeries'].data.shape
+    if len(shape) < 5:
+        return None
+
+    return axes_output_size(ax_video, shape[1], shape[2])
+
+
+def mip_output_size(ax, nwb_obj):
+    shape = nwb_obj.acquisition['NeuroPALImageRaw'].data.shape
+    if len(shape) < 4:
+        return None
+
+    return axes_output_size(ax, shape[2], shape[3])
+
+
+def mip_extent(nwb_obj):
+    # Full resolution voxel coordinates, so that neurons line up with a MIP projected from any multiscale level.
+    shape = nwb_obj.acquisition['NeuroPALImageRaw'].data.shape
+    if len(shape) < 4:
+        return None
+
+    return -0.5, shape[2] - 0.5, -0.5, shape[3] - 0.5
+
+
+def pixel_region(bbox, height):
+    # Display coordinates count up from the bottom of the figure, buffer rows count down from its top.
+    (x0, y0), (x1, y1) = np.round(bbox.get_points()).astype(int)
+    return slice(height - y1, height - y0), slice(x0, x1)
+
+
+def video_layout(fig, ax_video, image_shape):
+    # Buffer region the video image fills and, for each of its pixels, the source row and column to sample.
+    height = fig.canvas.get_width_height()[1]
+    (x0, y0), (x1, y1) = np.round(ax_video.transData.transform(
+        [(-0.5, -0.5), (image_shape[1] - 0.5, image_shape[0] - 0.5)])).astype(int)
+    region = slice(height - y1, height - y0), slice(x0, x1)
+
+    # origin='lower' puts the first image row at the bottom of the region.
+    rows = ((np.arange(y1 - y0) + 0.5) * image_shape[0] / (y1 - y0)).astype(int)[::-1]
+    cols = ((np.arange(x1 - x0) + 0.5) * image_shape[1] / (x1 - x0)).astype(int)
+    return region, rows, cols
+
+
+def title_renderer(fig, ax_video, widest_title):
+    # Titles are the only per-frame text, so each is drawn alone over a saved copy of its background.
+    height = fig.canvas.get_width_height()[1]
+    ax_video.set_title("", fontsize=10)
+    fig.canvas.draw()
+    background = np.asarray(fig.canvas.buffer_rgba())[..., :3].copy()
+
+    # The title is only placed during a draw, so the widest one is measured after it.
+    ax_video.title.set_text(widest_title)
+    bbox = ax_video.title.get_window_extent(fig.canvas.get_renderer()).padded(4)
+    title_background = fig.canvas.copy_from_bbox(bbox)
+    region = pixel_region(bbox, height)
+
+    def render_title(title):
+        fig.canvas.restore_region(title_background)
+        ax_video.title.set_text(title)
+        ax_video.draw_artist(ax_video.title)
+        return np.asarray(fig.canvas.buffer_rgba())[region + (slice(0, 3),)].copy()
+
+    return background, region, render_title
+
+
+def compose_frame(background, title_region, title, video_region, rows, cols, projected_frame):
+    frame = background.copy()
+    frame[title_region] = title
+    # imshow clips integer RGB data to [0, 255], and so does this.
+    frame[video_region] = np.clip(projected_frame[np.ix_(cols, rows)][..., :3].transpose(1, 0, 2), 0, 255)
+    return frame
+
+
+def write_video(frames, filename, size, fps=VIDEO_FPS):
+    ffmpeg_path = shutil.which(plt.rcParams['animation.ffmpeg_path'])
+    if ffmpeg_path is None:
+        # Without ffmpeg the frames are kept as a PNG sequence next to where the video would have been.
+        frame_dir = os.path.splitext(filename)[0] + "_frames"
+        os.makedirs(frame_dir, exist_ok=True)
+        for frame_idx, frame in enumerate(frames):
+            plt.imsave(os.path.join(frame_dir, f"frame_{frame_idx + 1:04d}.png"), frame)
+        return frame_dir
+
+    width, height = size
+    encoder = subprocess.Popen([ffmpeg_path, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+                                '-s', f"{width}x{height}", '-r', str(fps), '-i', '-', '-vcodec', 'libx264',
+                                '-pix_fmt', 'yuv420p', filename], stdin=subprocess.PIPE)
+    try:
+        for frame in frames:
+            encoder.stdin.write(np.ascontiguousarray(frame[:height, :width]).tobytes())
+    finally:
+        encoder.stdin.close()
+        if encoder.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with status {encoder.returncode} while writing {filename}")
+
+    return filename
+
+
+def render_video(fig, ax_video, projections, image_shape, last_frame, filename):
+    background, title_region, render_title = title_renderer(fig, ax_video,
+                                                            f"Calcium Imaging Series (t={last_frame})")
+    video_region, rows, cols = video_layout(fig, ax_video, image_shape)
+
+    # yuv420p needs even frame dimensions.
+    height, width = background.shape[:2]
+    size = (width - width % 2, height - height % 2)
+
+    def frames():
+        with ThreadPoolExecutor(max_workers=VIDEO_THREADS) as executor:
+            while True:
+                batch = list(itertools.islice(projections, VIDEO_THREADS * 2))
+                if not batch:
+                    return
+
+                # Titles are drawn on this thread, the matplotlib renderer is not thread safe.
+                titles = [render_title(f"Calcium Imaging Series (t={frame_idx})") for frame_idx, _ in batch]
+                yield from executor.map(
+                    lambda frame: compose_frame(background, title_region, frame[0], video_region, rows, cols,
+                                                frame[1][1]),
+                    zip(titles, batch))
+
+    return write_video(frames(), filename, size)
+
+
+def visualize(nwb_obj, mip_sidecar=False, video_mode='pipe', frames=VIDEO_FRAMES, video_path=None, summary_path=None,
+              activity_sidecar=False, targets=None):
     fig = plt.figure(figsize=(10, 10))
     gs = fig.add_gridspec(3, 2, height_ratios=[0.5, 3, 3], width_ratios=[3, 3])
+    # Adjusted up front so that the activity traces and the video level are sized for the final layout.
+    plt.subplots_adjust(left=0.02, right=0.98, top=0.98, bottom=0.05, wspace=0.3, hspace=0.3)
 
     ax_info = fig.add_subplot(gs[0, :])
     plot_subject_info(ax_info, nwb_obj)
 
     ax_worm = fig.add_subplot(gs[1, 0])
-    plot_worm(ax_worm, nwb_obj)
+    plot_worm(ax_worm, nwb_obj, mip_sidecar)
 
     ax_neurons = fig.add_subplot(gs[1, 1])
-    plot_neurons(ax_neurons, nwb_obj)
+    plot_neurons(ax_neurons, nwb_obj, mip_sidecar, targets)
 
     ax_video = fig.add_subplot(gs[2, 0])
     ax_activity = fig.add_subplot(gs[2, 1])
-    plot_activity(ax_activity, nwb_obj)
+    plot_activity(ax_activity, nwb_obj, activity_sidecar, targets)
 
-    video_array = nwb_obj.acquisition['CalciumImageSeries'].data[1:75, :, :, :, :]
-    if video_array.ndim < 5:
+    calcium_data = multiscale_level(nwb_obj.acquisition['CalciumImageSeries'].data, video_output_size(ax_video, nwb_obj))
+    frame_indices = range(*frames.indices(calcium_data.shape[0]))
+    if calcium_data.ndim < 5 or len(frame_indices) == 0:
         print("Data format not as expected.")
         plt.tight_layout()
         plt.show()
         return
 
-    max_projection = video_array.max(axis=3)
-    num_frames = min(75, max_projection.shape[0])
-    rgb_frame = np.zeros((max_projection.shape[2], max_projection.shape[1], 3), dtype=video_array.dtype)
-    for i, chan_idx in enumerate([0, 1, 2]):
-        rgb_frame[..., i] = max_projection[0, :, :, chan_idx].T
+    # Frames are projected one at a time as the video consumes them, however many are rendered.
+    projections = iter_frame_projections(calcium_data, frames, channels=[0, 1, 2])
+    first_frame = next(projections)
+    projections = itertools.chain([first_frame], projections)
+    rgb_frame = first_frame[1].transpose(1, 0, 2).copy()
     warnings.filterwarnings("ignore")
     im = ax_video.imshow(rgb_frame, origin='lower')
     ax_video.axis('off')
 
-    def update(frame_idx):
-        for i, chan_idx in enumerate([0, 1, 2]):
-            rgb_frame[..., i] = max_projection[frame_idx, :, :, chan_idx].T
+    def update(frame):
+        frame_idx, projection = frame
+        rgb_frame[...] = projection.transpose(1, 0, 2)
         im.set_data(rgb_frame)
-        ax_video.set_title(f"Calcium Imaging Series (t={frame_idx + 1})", fontsize=10)
+        ax_video.set_title(f"Calcium Imaging Series (t={frame_idx})", fontsize=10)
         return [im]
 
-    ani = animation.FuncAnimation(fig, update, frames=num_frames, interval=100, blit=True)
-    ff_writer = animation.FFMpegWriter(fps=10)
-    plt.subplots_adjust(left=0.02, right=0.98, top=0.98, bottom=0.05, wspace=0.3, hspace=0.3)
-
-    os.makedirs("nwb_validation_results", exist_ok=True)
-    filename = os.path.join(os.getcwd(), "nwb_validation_results",
-                            f"{nwb_obj.subject.subject_id}_{datetime.now().strftime('%Y%m%d')}.mp4")
+    if summary_path is not None:
+        ax_video.set_title(f"Calcium Imaging Series (t={frame_indices[0]})", fontsize=10)
+        fig.savefig(summary_path)
+
+    filename = video_path
+    if filename is None:
+        os.makedirs("nwb_validation_results", exist_ok=True)
+        filename = os.path.join(os.getcwd(), "nwb_validation_results",
+                                f"{nwb_obj.subject.subject_id}_{datetime.now().strftime('%Y%m%d')}.mp4")
+
+    # 'pipe' draws the figure once and streams composed frames straight to ffmpeg, 'animation' redraws the
+    # whole figure per frame through matplotlib.
+    if video_mode == 'pipe':
+        return render_video(fig, ax_video, projections, rgb_frame.shape[:2], max(frame_indices), filename)
+
+    ani = animation.FuncAnimation(fig, update, frames=projections, init_func=lambda: [im],
+                                  save_count=len(frame_indices), cache_frame_data=False, interval=1000 // VIDEO_FPS,
+                                  blit=True)
+    ff_writer = animation.FFMpegWriter(fps=VIDEO_FPS)
     ani.save(filename=filename, writer=ff_writer)
     #plt.show()
+    return filename
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+# The support library is run from nwb/ as the support_library package.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'nwb'))
+
+from support_library.nwb.synthetic import write_synthetic_scale  # noqa: E402
+
+SYNTHETIC_NAME = 'sub-20240101-h1_synthetic.nwb'
+
+
+def pytest_addoption(parser):
+    parser.addoption('--scales', default='small',
+                     help="comma-separated synthetic file scales (small, medium, large) to run the benchmarks at.")
+
+
+def pytest_generate_tests(metafunc):
+    if 'scale' in metafunc.fixturenames:
+        metafunc.parametrize('scale', metafunc.config.getoption('scales').split(','), scope='session')
+
+
+@pytest.fixture(scope='session')
+def scale_nwb(scale, tmp_path_factory):
+    filepath = str(tmp_path_factory.mktemp(scale) / SYNTHETIC_NAME)
+    write_synthetic_scale(filepath, scale, reference=True)
+    return filepath
+
+
+@pytest.fixture(scope='session')
+def synthetic_nwb(tmp_path_factory):
+    # A small synthetic file with its annotations.h5/worldlines.h5 tracking reference next to it.
+    filepath = str(tmp_path_factory.mktemp('synthetic') / SYNTHETIC_NAME)
+    write_synthetic_scale(filepath, 'small', reference=True)
+    return filepath
@@ -0,0 +1,40 @@
+import os
+import shutil
+
+import h5py
+
+from support_library.nwb import fixer
+from support_library.nwb.batch_fix import fix_file, fix_manifest, read_manifest
+
+
+def test_manifest_paths_are_relative_to_it(synthetic_nwb, tmp_path):
+    os.makedirs(tmp_path / 'data')
+    shutil.copyfile(synthetic_nwb, tmp_path / 'data' / 'a.nwb')
+    reference_dir = os.path.dirname(synthetic_nwb)
+    manifest_path = tmp_path / 'manifest.csv'
+    manifest_path.write_text(f"file,cultivation_temp,track_reference,track_reference_path\n"
+                             f"data/a.nwb,20,maedeh,{os.path.relpath(reference_dir, tmp_path)}\n")
+
+    entries = read_manifest(str(manifest_path))
+    assert entries[0]['file'] == str(tmp_path / 'data' / 'a.nwb')
+    assert os.path.samefile(entries[0]['reference_path'], reference_dir)
+
+    results = list(fix_manifest(entries, workers=1))
+    assert results[0]['error'] is None
+    assert os.path.exists(results[0]['output'])
+
+
+def test_unreadable_fix_is_a_failure(synthetic_nwb, tmp_path, monkeypatch):
+    filepath = str(tmp_path / 'a.nwb')
+    shutil.copyfile(synthetic_nwb, filepath)
+
+    def write_string_temperature(partial_path, **subject):
+        with h5py.File(partial_path, 'r+') as h5_file:
+            h5_file['general/subject'].create_dataset('cultivation_temp', data=subject['cultivation_temp'],
+                                                      dtype=h5py.string_dtype())
+
+    monkeypatch.setattr(fixer, 'fix_subject', write_string_temperature)
+    result = fix_file(filepath, {'cultivation_temp': '20'})
+
+    assert result['error'] is not None
+    assert sorted(os.listdir(tmp_path)) == ['a.nwb']
@@ -0,0 +1,86 @@
+import os
+import shutil
+
+import h5py
+import matplotlib
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+matplotlib.use('Agg')
+
+import matplotlib.animation as animation  # noqa: E402
+import matplotlib.pyplot as plt  # noqa: E402
+from pynwb import NWBHDF5IO  # noqa: E402
+
+from support_library.nwb import h5_validation  # noqa: E402
+from support_library.nwb.fixer import fix_subject, fix_track  # noqa: E402
+from support_library.nwb.validation import validate  # noqa: E402
+from support_library.nwb.visualizer import generate_mip, plot_activity, visualize  # noqa: E402
+
+# Times the library routines on synthetic files at each --scales size, e.g.
+#     python -m pytest tests/nwb/test_benchmarks.py --scales=small,medium
+# benchmarks.py compares the same routines against the implementations they replaced.
+
+
+@pytest.fixture
+def nwbfile(scale_nwb):
+    with NWBHDF5IO(scale_nwb, mode='r') as read_io:
+        yield read_io.read()
+
+
+@pytest.fixture
+def work_path(scale_nwb, tmp_path):
+    # The fixers rewrite their input, so each round starts from a fresh copy.
+    path = str(tmp_path / os.path.basename(scale_nwb))
+
+    def copy_file():
+        shutil.copyfile(scale_nwb, path)
+
+    return path, copy_file
+
+
+def draw_activity(nwbfile):
+    fig = plt.figure(figsize=(5, 5))
+    plot_activity(fig.add_subplot(), nwbfile)
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+def test_validate(benchmark, nwbfile):
+    is_valid, summary = benchmark(validate, nwbfile)
+    assert is_valid, summary
+
+
+def test_validate_fast(benchmark, scale_nwb):
+    with h5py.File(scale_nwb, 'r') as h5_file:
+        is_valid, summary = benchmark(h5_validation.validate, h5_file)
+    assert is_valid, summary
+
+
+def test_generate_mip(benchmark, nwbfile):
+    mip = benchmark(generate_mip, nwbfile)
+    assert mip.shape[-1] == 3
+
+
+def test_plot_activity(benchmark, nwbfile):
+    benchmark(draw_activity, nwbfile)
+
+
+@pytest.mark.skipif(not animation.FFMpegWriter.isAvailable(), reason="ffmpeg is not available")
+def test_visualize(benchmark, nwbfile, tmp_path):
+    benchmark.pedantic(visualize, args=(nwbfile,), kwargs={'video_path': str(tmp_path / 'video.mp4'),
+                                                          'summary_path': str(tmp_path / 'summary.png')},
+                       teardown=lambda *args, **kwargs: plt.close('all'), rounds=1)
+    assert os.path.exists(tmp_path / 'summary.png')
+
+
+def test_fix_subject(benchmark, work_path):
+    path, copy_file = work_path
+    benchmark.pedantic(fix_subject, args=(path,), kwargs={'strain': 'OH15500'}, setup=copy_file, rounds=3)
+
+
+def test_fix_track(benchmark, work_path, scale_nwb):
+    path, copy_file = work_path
+    output_path = benchmark.pedantic(fix_track, args=(path, 'maedeh'),
+                                     kwargs={'reference_path': os.path.dirname(scale_nwb)}, setup=copy_file, rounds=1)
+    assert os.path.exists(output_path)
@@ -0,0 +1,76 @@
+import os
+import shutil
+
+import h5py
+import pytest
+
+from support_library.nwb.cache import ValidationCache, file_key
+from support_library.nwb.corpus import validate_directory
+
+
+@pytest.fixture
+def cached_file(tmp_path):
+    filepath = str(tmp_path / 'a.nwb')
+    with h5py.File(filepath, 'w') as h5_file:
+        h5_file.create_dataset('general/session_description', data='cached')
+
+    validation_cache = ValidationCache(str(tmp_path / 'cache.sqlite'))
+    validation_cache.store(filepath, file_key(filepath), 'fast', True, "Subject: PASSED", [])
+    yield filepath, validation_cache
+    validation_cache.close()
+
+
+def cached_count(path, cache_path, **options):
+    return sum(result['cached'] for result in validate_directory(path, workers=1, cache=cache_path, **options))
+
+
+def test_rulesets_are_cached_apart(synthetic_nwb, tmp_path):
+    corpus_dir = tmp_path / 'corpus'
+    corpus_dir.mkdir()
+    shutil.copyfile(synthetic_nwb, corpus_dir / 'a.nwb')
+    cache_path = str(tmp_path / 'cache.sqlite')
+
+    assert cached_count(str(corpus_dir), cache_path, fast=True) == 0
+    assert cached_count(str(corpus_dir), cache_path, fast=True) == 1
+    assert cached_count(str(corpus_dir), cache_path, fast=True, fail_fast=True) == 0
+    assert cached_count(str(corpus_dir), cache_path, fast=True) == 1
+    assert cached_count(str(corpus_dir), cache_path, fast=True, fail_fast=True) == 1
+    assert cached_count(str(corpus_dir), cache_path) == 0
+    assert cached_count(str(corpus_dir), cache_path, fast=True) == 1
+
+
+def test_cache_hit(cached_file):
+    filepath, validation_cache = cached_file
+    key = file_key(filepath)
+
+    assert validation_cache.cached_fingerprint(filepath, 'fast') == key[2]
+    assert validation_cache.lookup(filepath, key, 'fast') == (True, "Subject: PASSED", [])
+
+
+@pytest.mark.parametrize('change', ['mtime', 'size'])
+def test_cache_misses_changed_files(cached_file, change):
+    filepath, validation_cache = cached_file
+    stat = os.stat(filepath)
+    if change == 'mtime':
+        os.utime(filepath, (stat.st_atime, stat.st_mtime + 10))
+    else:
+        # Grown, with the mtime put back, so that only the size tells the change apart.
+        with h5py.File(filepath, 'a') as h5_file:
+            h5_file.create_dataset('general/notes', data=list(range(1024)))
+        os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert os.stat(filepath).st_size != stat.st_size
+
+    assert validation_cache.cached_fingerprint(filepath, 'fast') is None
+    assert validation_cache.lookup(filepath, file_key(filepath), 'fast') is None
+
+
+def test_cache_separates_rulesets(cached_file):
+    filepath, validation_cache = cached_file
+    key = file_key(filepath)
+
+    assert validation_cache.cached_fingerprint(filepath, 'pynwb') is None
+    assert validation_cache.lookup(filepath, key, 'pynwb') is None
+
+    validation_cache.store(filepath, key, 'pynwb', False, "Subject: FAILED", [])
+    assert validation_cache.lookup(filepath, key, 'pynwb') == (False, "Subject: FAILED", [])
+    assert validation_cache.lookup(filepath, key, 'fast') == (True, "Subject: PASSED", [])
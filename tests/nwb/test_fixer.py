@@ -0,0 +1,85 @@
+import os
+import shutil
+
+import h5py
+import numpy as np
+import pytest
+from pynwb import NWBHDF5IO
+
+from support_library.nwb.fixer import fix_subject, fix_track
+from support_library.nwb.helper import decode_strings
+from support_library.nwb.neurons import (NEURON_INDEX_MEMO, NEURON_TABLES, lookup_names, read_table,
+                                         tracked_neurons_dataframe, tracks_at, trajectory)
+
+
+@pytest.fixture
+def fixed_nwb(synthetic_nwb, tmp_path):
+    filepath = str(tmp_path / 'fixed.nwb')
+    shutil.copyfile(synthetic_nwb, filepath)
+    return filepath
+
+
+def test_fix_subject_types_missing_fields(fixed_nwb):
+    # Manifest values are strings, the fields missing from the file are created with their spec dtype.
+    fix_subject(fixed_nwb, cultivation_temp='20', growth_stage_time='3h', date_of_birth='2024-01-01T00:00:00+00:00')
+
+    with h5py.File(fixed_nwb, 'r') as h5_file:
+        subject = h5_file['general/subject']
+        assert subject['cultivation_temp'].dtype.kind == 'f'
+        assert 'growth_stage_time' in subject.attrs
+
+    with NWBHDF5IO(fixed_nwb, mode='r') as read_io:
+        subject = read_io.read().subject
+        assert subject.cultivation_temp == 20.0
+        assert subject.growth_stage_time == '3h'
+        assert subject.date_of_birth.year == 2024
+
+
+def test_fix_subject_rejects_untyped_values(fixed_nwb):
+    with pytest.raises(ValueError):
+        fix_subject(fixed_nwb, cultivation_temp='warm')
+
+
+def test_fix_track_round_trip(synthetic_nwb, tmp_path):
+    reference_path = os.path.dirname(synthetic_nwb)
+    updated_path = fix_track(synthetic_nwb, 'maedeh', reference_path, output_path=str(tmp_path / 'tracked.nwb'))
+
+    with h5py.File(os.path.join(reference_path, 'worldlines.h5'), 'r') as worldlines:
+        worldline_names = dict(zip(worldlines['id'][:], decode_strings(worldlines['name'][:])))
+    with h5py.File(os.path.join(reference_path, 'annotations.h5'), 'r') as annotations:
+        frame = int(annotations['t_idx'][0])
+        expected = sorted(worldline_names[wl_id] for wl_id in annotations['worldline_id'][:][
+            annotations['t_idx'][:] == frame])
+
+    with NWBHDF5IO(updated_path, mode='r') as read_io:
+        nwbfile = read_io.read()
+        table = nwbfile.processing['NeuroPAL']['TrackedNeurons']
+        # neuron_id is a region into TrackedNeuronNames, so pynwb resolves the names itself.
+        rows = table['t'].data[:] == frame
+        assert sorted(table['neuron_id'][np.flatnonzero(rows).tolist()]['neuron']) == expected
+        assert len(table.to_dataframe(index=True)) == len(table)
+
+        dataframe = tracked_neurons_dataframe(nwbfile)
+        assert sorted(dataframe['neuron_id'][dataframe['t'] == frame]) == expected
+
+        names, positions = tracks_at(nwbfile, frame)
+        assert sorted(names) == expected
+        assert positions.shape == (len(expected), 3)
+
+
+def test_trajectory_indexes_after_first_scan(synthetic_nwb, tmp_path):
+    reference_path = os.path.dirname(synthetic_nwb)
+    updated_path = fix_track(synthetic_nwb, 'maedeh', reference_path, output_path=str(tmp_path / 'tracked.nwb'))
+
+    with NWBHDF5IO(updated_path, mode='r') as read_io:
+        nwbfile = read_io.read()
+        table = read_table(nwbfile, *NEURON_TABLES['tracked'])
+        names = lookup_names(nwbfile, table, 'neuron_id')
+        assert lookup_names(nwbfile, table, 'neuron_id') is names
+
+        # The first query scans the table and the second builds the name index, both finding the same rows.
+        scanned = trajectory(nwbfile, names[0])
+        assert 'tracked' not in NEURON_INDEX_MEMO.get(nwbfile, {})
+        indexed = trajectory(nwbfile, names[0])
+        assert 'tracked' in NEURON_INDEX_MEMO[nwbfile]
+        assert len(scanned[0]) and all(np.array_equal(a, b) for a, b in zip(scanned, indexed))
@@ -0,0 +1,53 @@
+import logging
+import os
+import shutil
+import warnings
+
+import matplotlib.pyplot as plt
+import pytest
+
+from support_library.nwb import visualizer
+from support_library.nwb.gallery import visualize_directory
+
+
+@pytest.fixture
+def corpus_dir(synthetic_nwb, tmp_path):
+    corpus_dir = tmp_path / 'corpus'
+    corpus_dir.mkdir()
+    shutil.copyfile(synthetic_nwb, corpus_dir / 'a.nwb')
+    return str(corpus_dir)
+
+
+def test_serial_render_restores_settings(corpus_dir, tmp_path):
+    backend = plt.get_backend()
+    plt.switch_backend('pdf')
+    logger = logging.getLogger('matplotlib.image')
+    level = logger.level
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('default')
+            filters = list(warnings.filters)
+            results = list(visualize_directory(corpus_dir, workers=1, output_dir=str(tmp_path / 'out'),
+                                               frames=slice(0, 2)))
+
+            assert results[0]['error'] is None
+            assert plt.get_backend() == 'pdf'
+            assert warnings.filters == filters
+            assert logger.level == level
+    finally:
+        plt.switch_backend(backend)
+
+
+def test_failed_render_removes_partial_files(corpus_dir, tmp_path, monkeypatch):
+    def failing_visualize(nwb_obj, video_path=None, summary_path=None, **kwargs):
+        for path in [summary_path, video_path]:
+            with open(path, 'wb'):
+                pass
+        raise RuntimeError("encoder failed")
+
+    monkeypatch.setattr(visualizer, 'visualize', failing_visualize)
+    output_dir = str(tmp_path / 'out')
+    results = list(visualize_directory(corpus_dir, workers=1, output_dir=output_dir, frames=slice(0, 2)))
+
+    assert results[0]['error'] == "RuntimeError: encoder failed"
+    assert os.listdir(output_dir) == []
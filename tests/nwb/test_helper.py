@@ -0,0 +1,98 @@
+import os
+import warnings
+from contextlib import contextmanager
+
+import h5py
+import numpy as np
+import pytest
+
+from support_library.nwb.helper import decimation_pyramid, iter_frame_projections, max_projection, run_pool, scan_nans
+
+
+@pytest.fixture
+def calcium_series(tmp_path):
+    # (T, X, Y, Z, C), chunked several frames at a time so blocks hold more than one frame.
+    data = np.random.default_rng(0).integers(0, 4096, size=(30, 8, 6, 4, 3), dtype=np.uint16)
+    with h5py.File(tmp_path / 'series.h5', 'w') as h5_file:
+        h5_file.create_dataset('data', data=data, chunks=(8, 8, 6, 4, 3))
+    with h5py.File(tmp_path / 'series.h5', 'r') as h5_file:
+        yield h5_file['data'], data
+
+
+@pytest.mark.parametrize('frames', [slice(None), slice(3, 29, 4), slice(None, None, -1), slice(8, 2, -2),
+                                    slice(27, None, -5), slice(5, 5)])
+def test_iter_frame_projections(calcium_series, frames):
+    dataset, data = calcium_series
+    projections = list(iter_frame_projections(dataset, frames, channels=[2, 0]))
+
+    assert [frame_idx for frame_idx, _ in projections] == list(range(*frames.indices(len(data))))
+    for frame_idx, projection in projections:
+        np.testing.assert_array_equal(projection, data[frame_idx].max(axis=2)[..., [2, 0]])
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_run_pool(workers):
+    entered = []
+
+    @contextmanager
+    def serial_context():
+        entered.append(True)
+        yield
+
+    tasks = [(os.path.join('data', f"{n}.nwb"),) for n in range(4)]
+    results = list(run_pool(os.path.basename, tasks, workers, serial_context=serial_context))
+    assert sorted(results) == [f"{n}.nwb" for n in range(4)]
+    # Only calls in this process are wrapped in serial_context.
+    assert len(entered) == (len(tasks) if workers == 1 else 0)
+
+
+def test_scan_nans_dense():
+    # Rows of a million values, so that each is a scan block of its own.
+    data = np.zeros((4, 1024 * 1024))
+    data[1, [3, 7]] = np.nan
+    data[3, 0] = np.nan
+
+    assert scan_nans(data, early_exit=False) == (3, 1)
+    assert scan_nans(data) == (2, 1)
+    assert scan_nans(np.zeros((4, 3))) == (0, None)
+    assert scan_nans(np.arange(12).reshape(4, 3)) == (0, None)
+
+
+def test_scan_nans_ragged():
+    # Rows of 2, 0, 3 and 1 values, the NaNs in the last two.
+    values = np.array([0.0, 1.0, 2.0, np.nan, 4.0, np.nan])
+    index = np.array([2, 2, 5, 6])
+
+    assert scan_nans(values, early_exit=False, index=index) == (2, 2)
+    assert scan_nans(np.arange(3.0), index=np.array([1, 3])) == (0, None)
+
+
+def test_decimation_pyramid():
+    data = np.random.default_rng(0).normal(size=(3, 1000)).astype(np.float32)
+    data[0, 10:20] = np.nan
+    data[1, :64] = np.nan
+
+    pyramid = decimation_pyramid(data, factor=4, max_bins=16)
+    assert len(pyramid) == 3
+    with warnings.catch_warnings():
+        # Bins holding only NaNs have a NaN minimum and maximum.
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for level, (mins, maxs) in enumerate(pyramid, start=1):
+            bins = [data[:, start:start + 4 ** level] for start in range(0, data.shape[1], 4 ** level)]
+            np.testing.assert_array_equal(mins, np.stack([np.nanmin(b, axis=1) for b in bins], axis=1))
+            np.testing.assert_array_equal(maxs, np.stack([np.nanmax(b, axis=1) for b in bins], axis=1))
+
+    assert decimation_pyramid(data[:, :16], factor=4, max_bins=16) == []
+
+
+@pytest.mark.parametrize('memory_budget', [1, 64 * 1024 * 1024])
+def test_max_projection(tmp_path, memory_budget):
+    # (C, Z, X, Y) with Z chunked, against the whole-stack max of the original generate_mip. A tiny budget projects
+    # one chunk of planes at a time.
+    data = np.random.default_rng(0).integers(0, 4096, size=(4, 12, 8, 6), dtype=np.uint16)
+    with h5py.File(tmp_path / 'stack.h5', 'w') as h5_file:
+        h5_file.create_dataset('data', data=data, chunks=(1, 5, 8, 6))
+    with h5py.File(tmp_path / 'stack.h5', 'r') as h5_file:
+        projection = max_projection(h5_file['data'], [2, 0, 3], memory_budget=memory_budget)
+
+    np.testing.assert_array_equal(projection, data.max(axis=1)[[2, 0, 3]])
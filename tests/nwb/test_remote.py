@@ -0,0 +1,83 @@
+import io
+import os
+import re
+import shutil
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip('fsspec')
+pytest.importorskip('aiohttp')
+
+from support_library.nwb.corpus import list_nwb_files, validate_file  # noqa: E402
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    # SimpleHTTPRequestHandler ignores Range headers, which the HDF5 block cache relies on.
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        byte_range = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if os.path.isdir(path) or not os.path.isfile(path) or byte_range is None:
+            return super().send_head()
+
+        size = os.path.getsize(path)
+        start = int(byte_range[1])
+        stop = min(int(byte_range[2]) if byte_range[2] else size - 1, size - 1)
+        with open(path, 'rb') as served_file:
+            served_file.seek(start)
+            data = served_file.read(stop - start + 1)
+
+        self.send_response(206)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Range', f"bytes {start}-{stop}/{size}")
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        return io.BytesIO(data)
+
+
+@pytest.fixture(scope='module')
+def served_nwb(synthetic_nwb, tmp_path_factory):
+    # Serves a directory holding only the synthetic NWB file, yielding its local path and URL.
+    served_dir = tmp_path_factory.mktemp('served')
+    filepath = shutil.copy(synthetic_nwb, served_dir / os.path.basename(synthetic_nwb))
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                 lambda *args: RangeRequestHandler(*args, directory=str(served_dir)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield str(filepath), f"http://127.0.0.1:{server.server_address[1]}/{os.path.basename(filepath)}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize('fast', [True, False])
+def test_remote_issues_match_local(served_nwb, fast):
+    filepath, url = served_nwb
+    local_result = validate_file(filepath, fast=fast)
+    remote_result = validate_file(url, fast=fast)
+
+    assert remote_result['error'] is None
+    assert remote_result['is_valid'] == local_result['is_valid']
+    assert remote_result['summary'] == local_result['summary']
+    assert [{**issue, 'file': None} for issue in remote_result['issues']] == \
+        [{**issue, 'file': None} for issue in local_result['issues']]
+
+
+def test_remote_fetches_only_metadata(served_nwb):
+    filepath, url = served_nwb
+    result = validate_file(url, fast=True)
+
+    assert result['size'] == os.path.getsize(filepath)
+    assert 0 < result['bytes_fetched'] < result['size'] / 4
+
+
+def test_remote_directory_listing(served_nwb):
+    filepath, url = served_nwb
+    assert list_nwb_files(url.rsplit('/', 1)[0] + '/') == [url]
@@ -0,0 +1,73 @@
+import h5py
+import pytest
+
+from support_library.nwb import rules
+from support_library.nwb.rules import COST_METADATA, COST_SCAN, plan_rules, rule, run_rules
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    # An empty rule registry, so that each test declares only the rules it plans or runs.
+    monkeypatch.setattr(rules, 'RULES', {})
+
+
+@pytest.fixture
+def h5_file(tmp_path):
+    with h5py.File(tmp_path / 'empty.h5', 'w') as h5_file:
+        yield h5_file
+
+
+def declare(rule_id, issues=(), after=(), severity='error', cost=COST_METADATA, calls=None):
+    @rule(rule_id, after=after, severity=severity, cost=cost)
+    def check(context, params):
+        if calls is not None:
+            calls.append(rule_id)
+        for detail in issues:
+            yield None, None, detail
+
+
+def test_plan_rules_runs_dependencies_first(registry):
+    declare('subject.late', after=['subject.early', 'subject.unlisted'])
+    declare('subject.early')
+
+    assert plan_rules(['subject.late', 'subject.early']) == ['subject.early', 'subject.late']
+    assert plan_rules(['subject.late']) == ['subject.late']
+
+
+def test_plan_rules_fail_fast_runs_cheapest_first(registry):
+    declare('subject.scan', cost=COST_SCAN)
+    declare('subject.metadata')
+    declare('subject.after_scan', after=['subject.scan'])
+
+    rule_ids = ['subject.scan', 'subject.after_scan', 'subject.metadata']
+    assert plan_rules(rule_ids) == rule_ids
+    assert plan_rules(rule_ids, fail_fast=True) == ['subject.metadata', 'subject.scan', 'subject.after_scan']
+
+
+def test_plan_rules_rejects_circular_dependencies(registry):
+    declare('subject.a', after=['subject.b'])
+    declare('subject.b', after=['subject.a'])
+
+    with pytest.raises(ValueError, match='Circular'):
+        plan_rules(['subject.a', 'subject.b'])
+
+
+def test_plan_rules_rejects_unknown_rules(registry):
+    with pytest.raises(ValueError, match='Unknown'):
+        plan_rules(['subject.missing'])
+
+
+def test_run_rules_fail_fast_stops_at_first_error(registry, h5_file):
+    calls = []
+    declare('subject.warning', issues=['lowered'], severity='warning', calls=calls)
+    declare('subject.error', issues=['first', 'second'], calls=calls)
+    declare('subject.later', issues=['unreached'], cost=COST_SCAN, calls=calls)
+    profile = {'rules': {'subject.warning': {}, 'subject.error': {}, 'subject.later': {}}}
+
+    # A leading warning does not stop the run, the first error does, dropping its later issues and later rules.
+    issues = run_rules(h5_file, profile=profile, fail_fast=True)
+    assert [(issue.severity, issue.detail) for issue in issues] == [('warning', 'lowered'), ('error', 'first')]
+    assert calls == ['subject.warning', 'subject.error']
+
+    issues = run_rules(h5_file, profile=profile)
+    assert [issue.detail for issue in issues] == ['lowered', 'first', 'second', 'unreached']
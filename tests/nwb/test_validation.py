@@ -0,0 +1,75 @@
+import copy
+import shutil
+from datetime import datetime, timezone
+
+import h5py
+import numpy as np
+import pytest
+from hdmf.common import DynamicTable
+from ndx_multichannel_volume import CElegansSubject
+from pynwb import NWBFile, NWBHDF5IO
+
+from support_library.nwb.corpus import validate_file
+from support_library.nwb.profiles import load_profile
+from support_library.nwb.validation import validate, validate_subject
+
+
+@pytest.fixture
+def ragged_nwb(synthetic_nwb, tmp_path):
+    # Activity rows of different lengths make a ragged column, its values in Activity and offsets in Activity_index.
+    filepath = str(tmp_path / 'ragged.nwb')
+    shutil.copyfile(synthetic_nwb, filepath)
+    with NWBHDF5IO(filepath, mode='a') as append_io:
+        nwbfile = append_io.read()
+        table = DynamicTable(name='RaggedActivity', description='Ragged activity traces')
+        table.add_column('Activity', 'Activity trace', index=True)
+        for trace in [[1.0, 2.0, 3.0], [4.0], [1.0, np.nan], [np.nan]]:
+            table.add_row(Activity=trace)
+        nwbfile.processing['CalciumActivity'].add(table)
+        append_io.write(nwbfile)
+
+    return filepath
+
+
+@pytest.mark.parametrize('fast', [True, False])
+def test_ragged_activity_nans(ragged_nwb, fast):
+    result = validate_file(ragged_nwb, fast=fast)
+    details = [issue['detail'] for issue in result['issues'] if issue['rule'] == 'processing.activity_nan']
+    assert details == ["CalciumActivity RaggedActivity contains 2 NaN values in Activity column (first at row 2)"]
+
+
+def test_unspecified_strain_fails_unless_the_profile_lowers_it(synthetic_nwb, tmp_path):
+    filepath = str(tmp_path / 'strain.nwb')
+    shutil.copyfile(synthetic_nwb, filepath)
+    with h5py.File(filepath, 'r+') as h5_file:
+        h5_file['general/subject/strain'][...] = b'[]'
+
+    result = validate_file(filepath, fast=True)
+    assert not result['is_valid']
+    assert "Strain: not specified" in result['summary']
+
+    profile = copy.deepcopy(load_profile())
+    profile['rules']['subject.strain']['severity'] = 'warning'
+    result = validate_file(filepath, fast=True, profile=profile)
+    assert result['is_valid']
+    assert "Strain: not specified" in result['summary']
+
+
+def test_validate_read_object_matches_its_file(synthetic_nwb):
+    with NWBHDF5IO(synthetic_nwb, mode='r') as read_io:
+        assert validate(read_io.read()) == validate(synthetic_nwb)
+
+
+def test_validate_object_built_in_memory():
+    nwbfile = NWBFile(session_description='in memory', identifier='in-memory',
+                      session_start_time=datetime(2024, 1, 1, tzinfo=timezone.utc))
+    nwbfile.subject = CElegansSubject(subject_id='sub-20240101-h1', description='in memory', sex='Q',
+                                      species='http://purl.obolibrary.org/obo/NCBITaxon_6239', strain='OH15500',
+                                      growth_stage='YA')
+
+    is_valid, summary = validate(nwbfile)
+    assert not is_valid
+    assert "Sex: invalid" in summary
+    assert validate_subject(nwbfile) == ["Sex: invalid"]
+    # The object is left as it was, and can still be written to a file.
+    assert nwbfile.container_source is None
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from support_library.nwb.visualizer import gamma_correct
+
+
+def baseline_gamma_correct(channel_data, gamma):
+    # The float64 correction generate_mip applied before gamma_correct.
+    channel_data = channel_data.astype(float)
+    max_val = channel_data.max() if channel_data.max() != 0 else 1
+    channel_data /= max_val
+    channel_data = np.power(channel_data, 1.0 / gamma)
+    channel_data *= max_val
+    return channel_data
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.uint16, np.float32, np.float64])
+@pytest.mark.parametrize('gamma', [0.5, 1.0, 2.2])
+def test_gamma_correct_matches_baseline(dtype, gamma):
+    max_value = np.iinfo(dtype).max if np.issubdtype(dtype, np.integer) else 4095
+    channel_data = np.random.default_rng(0).integers(0, max_value, size=(64, 48), endpoint=True).astype(dtype)
+
+    np.testing.assert_allclose(gamma_correct(channel_data, gamma), baseline_gamma_correct(channel_data, gamma),
+                               rtol=1e-5)
+
+
+def test_gamma_correct_blank_channel():
+    channel_data = np.zeros((4, 3), dtype=np.uint16)
+    np.testing.assert_array_equal(gamma_correct(channel_data, 2.2), np.zeros((4, 3)))